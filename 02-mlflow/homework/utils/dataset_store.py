@@ -0,0 +1,100 @@
+import hashlib
+import json
+import os
+import pickle
+
+import numpy as np
+import scipy.sparse as sp
+import sklearn
+
+# A split is stored as <data_path>/<name>/{data,indices,indptr,y}.npy, which
+# np.load can memory-map, so loading is near-instant and processes reading the
+# same split share its pages. manifest.json describes every split.
+MANIFEST_FILE = "manifest.json"
+FORMAT_VERSION = 1
+CSR_ARRAYS = ("data", "indices", "indptr")
+
+
+def read_manifest(data_path: str):
+    manifest_path = os.path.join(data_path, MANIFEST_FILE)
+    if not os.path.exists(manifest_path):
+        return None
+    with open(manifest_path, "r", encoding="utf-8") as f_in:
+        return json.load(f_in)
+
+
+def save_dataset(data_path: str, splits: dict, dv=None):
+    """
+    Save {name: (X, y)} splits, X a sparse (or dense) feature matrix and
+    y the targets. The manifest records row counts, shapes and the
+    DictVectorizer the features came from.
+    """
+    manifest = {
+        "format_version": FORMAT_VERSION,
+        "sklearn_version": sklearn.__version__,
+        "splits": {},
+    }
+    if dv is not None:
+        feature_names = "\n".join(dv.feature_names_)
+        manifest["dict_vectorizer"] = {
+            "n_features": len(dv.feature_names_),
+            "features_sha256": hashlib.sha256(feature_names.encode()).hexdigest(),
+        }
+
+    # The manifest of an earlier run must not vouch for arrays half rewritten
+    # by this one, so it goes first and is written again last
+    manifest_path = os.path.join(data_path, MANIFEST_FILE)
+    if os.path.exists(manifest_path):
+        os.remove(manifest_path)
+
+    for name, (X, y) in splits.items():
+        X = sp.csr_matrix(X)
+        y = np.asarray(y)
+        split_path = os.path.join(data_path, name)
+        os.makedirs(split_path, exist_ok=True)
+        for array_name in CSR_ARRAYS:
+            np.save(os.path.join(split_path, f"{array_name}.npy"), getattr(X, array_name))
+        np.save(os.path.join(split_path, "y.npy"), y)
+        manifest["splits"][name] = {
+            "rows": X.shape[0],
+            "shape": list(X.shape),
+            "nnz": int(X.nnz),
+            "dtype": str(X.dtype),
+        }
+
+    # Written last, a store without a manifest is incomplete
+    with open(manifest_path, "w", encoding="utf-8") as f_out:
+        json.dump(manifest, f_out, indent=2)
+    return manifest
+
+
+def load_dataset(data_path: str, name: str, mmap: bool = True):
+    """
+    (X, y) for one split, X a csr_matrix over the (memory-mapped) arrays.
+    Falls back to the <name>.pkl tuples written by older preprocess runs.
+    """
+    manifest = read_manifest(data_path)
+    if manifest is None:
+        pickle_path = os.path.join(data_path, f"{name}.pkl")
+        if not os.path.exists(pickle_path) and os.path.isdir(os.path.join(data_path, name)):
+            raise ValueError(f"{data_path} has no {MANIFEST_FILE}, save_dataset did not finish")
+        with open(pickle_path, "rb") as f_in:
+            return pickle.load(f_in)
+
+    if manifest["format_version"] != FORMAT_VERSION:
+        raise ValueError(f"Unsupported dataset format {manifest['format_version']}")
+    split = manifest["splits"][name]
+
+    mmap_mode = "r" if mmap else None
+    split_path = os.path.join(data_path, name)
+    data, indices, indptr = (
+        np.load(os.path.join(split_path, f"{array_name}.npy"), mmap_mode=mmap_mode)
+        for array_name in CSR_ARRAYS
+    )
+    y = np.load(os.path.join(split_path, "y.npy"), mmap_mode=mmap_mode)
+
+    if len(indptr) != split["rows"] + 1 or len(y) != split["rows"]:
+        raise ValueError(f"{split_path} does not match {MANIFEST_FILE}")
+
+    X = sp.csr_matrix((data, indices, indptr), shape=tuple(split["shape"]), copy=False)
+    return X, y
@@ -1,20 +1,85 @@
 import os
-import pickle
 import click
 import mlflow
 import optuna
 
+from concurrent.futures import ProcessPoolExecutor
 from optuna.samplers import TPESampler
 from sklearn.ensemble import RandomForestRegressor
 from sklearn.metrics import mean_squared_error
 
+from dataset_store import load_dataset
+
 mlflow.set_tracking_uri("http://0.0.0.0:5002")
 mlflow.set_experiment("random-forest-hyperopt")
 
+SEED = 42
+STUDY_NAME = "random-forest-hyperopt"
+
+
+def split_cores(n_workers: int, num_trials: int, n_cores: int = None):
+    """
+    (trial workers, RandomForest n_jobs) for the box. n_workers=0 picks one
+    worker per core (capped by num_trials): independent trials scale better
+    than the trees of a single small forest. Cores left over go to n_jobs.
+    """
+    n_cores = n_cores or os.cpu_count() or 1
+    if n_workers <= 0:
+        n_workers = n_cores
+    n_workers = max(1, min(n_workers, num_trials, n_cores))
+    return n_workers, max(1, n_cores // n_workers)
+
+
+def get_storage(storage: str):
+    # Database URLs (sqlite:///hpo.db) are used as they are, anything else
+    # is a journal file that several processes can append to
+    if storage is None or "://" in storage:
+        return storage
+    try:
+        backend = optuna.storages.journal.JournalFileBackend(storage)
+    except AttributeError:  # optuna < 4
+        backend = optuna.storages.JournalFileStorage(storage)
+    return optuna.storages.JournalStorage(backend)
+
+
+def objective(trial, X_train, y_train, X_val, y_val, n_jobs: int = -1):
+    with mlflow.start_run():
+        params = {
+            'n_estimators': trial.suggest_int('n_estimators', 10, 50, 1),
+            'max_depth': trial.suggest_int('max_depth', 1, 20, 1),
+            'min_samples_split': trial.suggest_int('min_samples_split', 2, 10, 1),
+            'min_samples_leaf': trial.suggest_int('min_samples_leaf', 1, 4, 1),
+            'random_state': 42,
+            'n_jobs': n_jobs
+        }
+
+        rf = RandomForestRegressor(**params)
+        mlflow.log_params(params)
+        rf.fit(X_train, y_train)
+        y_pred = rf.predict(X_val)
+        rmse = mean_squared_error(y_val, y_pred, squared=False)
+        mlflow.log_metric('rmse', rmse)
+
+    return rmse
+
+
+def run_worker(data_path: str, storage: str, study_name: str, n_trials: int,
+               n_jobs: int, seed: int):
+    # The splits are memory-mapped, so workers share one copy of the pages
+    X_train, y_train = load_dataset(data_path, "train")
+    X_val, y_val = load_dataset(data_path, "val")
 
-def load_pickle(filename):
-    with open(filename, "rb") as f_in:
-        return pickle.load(f_in)
+    # Each worker gets its own seed, or they would all suggest the same
+    # parameters until the first trials finish
+    study = optuna.load_study(
+        study_name=study_name,
+        storage=get_storage(storage),
+        sampler=TPESampler(seed=seed),
+    )
+    study.optimize(
+        lambda trial: objective(trial, X_train, y_train, X_val, y_val, n_jobs),
+        n_trials=n_trials,
+    )
 
 
 @click.command()
@@ -28,35 +93,61 @@ def load_pickle(filename):
     default=10,
     help="The number of parameter evaluations for the optimizer to explore"
 )
-def run_optimization(data_path: str, num_trials: int):
-    
-    X_train, y_train = load_pickle(os.path.join(data_path, "train.pkl"))
-    X_val, y_val = load_pickle(os.path.join(data_path, "val.pkl"))
-
-    def objective(trial):
-        with mlflow.start_run():
-            params = {
-                'n_estimators': trial.suggest_int('n_estimators', 10, 50, 1),
-                'max_depth': trial.suggest_int('max_depth', 1, 20, 1),
-                'min_samples_split': trial.suggest_int('min_samples_split', 2, 10, 1),
-                'min_samples_leaf': trial.suggest_int('min_samples_leaf', 1, 4, 1),
-                'random_state': 42,
-                'n_jobs': -1
-            }
-
-            rf = RandomForestRegressor(**params)
-            mlflow.log_params(params)
-            rf.fit(X_train, y_train)
-            y_pred = rf.predict(X_val)
-            rmse = mean_squared_error(y_val, y_pred, squared=False)
-            mlflow.log_metric('rmse', rmse)
-
-        return rmse
-
-    sampler = TPESampler(seed=42)
-    study = optuna.create_study(direction="minimize", sampler=sampler)
-    study.optimize(objective, n_trials=num_trials)
+@click.option(
+    "--n_workers",
+    default=1,
+    help="Trials run concurrently in separate processes, 0 for one per core"
+)
+@click.option(
+    "--storage",
+    default=None,
+    help="Optuna storage shared by the workers: a sqlite:/// URL or a journal "
+         "file path (default: <data_path>/optuna_journal.log when n_workers > 1)"
+)
+def run_optimization(data_path: str, num_trials: int, n_workers: int = 1,
+                     storage: str = None):
+
+    n_workers, n_jobs = split_cores(n_workers, num_trials)
+
+    if n_workers == 1 and storage is None:
+        X_train, y_train = load_dataset(data_path, "train")
+        X_val, y_val = load_dataset(data_path, "val")
+
+        sampler = TPESampler(seed=SEED)
+        study = optuna.create_study(direction="minimize", sampler=sampler)
+        study.optimize(
+            lambda trial: objective(trial, X_train, y_train, X_val, y_val),
+            n_trials=num_trials,
+        )
+        return study
+
+    if storage is None:
+        storage = os.path.join(data_path, "optuna_journal.log")
+    study = optuna.create_study(
+        study_name=STUDY_NAME,
+        storage=get_storage(storage),
+        direction="minimize",
+        load_if_exists=True,
+    )
+
+    # num_trials split as evenly as possible between the workers
+    trials_per_worker = [
+        num_trials // n_workers + (i < num_trials % n_workers)
+        for i in range(n_workers)
+    ]
+    print(f"Running {num_trials} trials on {n_workers} workers with n_jobs={n_jobs}")
+    with ProcessPoolExecutor(max_workers=n_workers) as executor:
+        futures = [
+            executor.submit(run_worker, data_path, storage, STUDY_NAME, n_trials,
+                            n_jobs, SEED + i)
+            for i, n_trials in enumerate(trials_per_worker)
+        ]
+        for future in futures:
+            future.result()
+
+    print(f"Best trial: {study.best_trial.params} rmse={study.best_value:.4f}")
+    return study
 
 
 if __name__ == '__main__':
-    run_optimization()
\ No newline at end of file
+    run_optimization()
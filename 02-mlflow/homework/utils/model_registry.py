@@ -1,5 +1,3 @@
-import os
-import pickle
 import click
 import mlflow
 
@@ -8,6 +6,8 @@ from mlflow.tracking import MlflowClient
 from sklearn.ensemble import RandomForestRegressor
 from sklearn.metrics import mean_squared_error
 
+from dataset_store import load_dataset
+
 HPO_EXPERIMENT_NAME = "random-forest-hyperopt"
 EXPERIMENT_NAME = "random-forest-best-models"
 RF_PARAMS = ['max_depth', 'n_estimators', 'min_samples_split', 'min_samples_leaf', 'random_state', 'n_jobs']
@@ -17,15 +17,10 @@ mlflow.set_experiment(EXPERIMENT_NAME)
 mlflow.sklearn.autolog()
 
 
-def load_pickle(filename):
-    with open(filename, "rb") as f_in:
-        return pickle.load(f_in)
-
-
 def train_and_log_model(data_path, params):
-    X_train, y_train = load_pickle(os.path.join(data_path, "train.pkl"))
-    X_val, y_val = load_pickle(os.path.join(data_path, "val.pkl"))
-    X_test, y_test = load_pickle(os.path.join(data_path, "test.pkl"))
+    X_train, y_train = load_dataset(data_path, "train")
+    X_val, y_val = load_dataset(data_path, "val")
+    X_test, y_test = load_dataset(data_path, "test")
 
     with mlflow.start_run():
         for param in RF_PARAMS:
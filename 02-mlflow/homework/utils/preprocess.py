@@ -5,6 +5,10 @@ import pandas as pd
 
 from sklearn.feature_extraction import DictVectorizer
 
+from column_vectorizer import ColumnVectorizer, pair_key, pair_name
+from dataset_store import save_dataset
+from trips import read_trips
+
 
 def dump_pickle(obj, filename: str):
     with open(filename, "wb") as f_out:
@@ -12,27 +16,30 @@ def dump_pickle(obj, filename: str):
 
 
 def read_dataframe(filename: str):
-    df = pd.read_parquet(filename)
-
-    df['duration'] = df['lpep_dropoff_datetime'] - df['lpep_pickup_datetime']
-    df.duration = df.duration.apply(lambda td: td.total_seconds() / 60)
-    df = df[(df.duration >= 1) & (df.duration <= 60)]
-
-    categorical = ['PULocationID', 'DOLocationID']
-    df[categorical] = df[categorical].astype(str)
-
-    return df
+    # Only the columns the features and the target need, the location ids
+    # stay numeric for the pair keys
+    return read_trips(filename, columns=['trip_distance', 'tip_amount'],
+                      cast_categorical=False)
 
 
 def preprocess(df: pd.DataFrame, dv: DictVectorizer, fit_dv: bool = False):
-    df['PU_DO'] = df['PULocationID'] + '_' + df['DOLocationID']
+    # PU * 1000 + DO integers, named "PU_DO=<PU>_<DO>" in the vocabulary
+    df['PU_DO'] = pair_key(df['PULocationID'], df['DOLocationID'])
     categorical = ['PU_DO']
     numerical = ['trip_distance']
-    dicts = df[categorical + numerical].to_dict(orient='records')
+    value_names = {'PU_DO': pair_name}
+    # Vectorized straight from the columns, the returned dv is still a
+    # fitted DictVectorizer
     if fit_dv:
-        X = dv.fit_transform(dicts)
+        vectorizer = ColumnVectorizer(categorical, numerical,
+                                      separator=dv.separator, dtype=dv.dtype,
+                                      value_names=value_names)
+        X = vectorizer.fit_transform(df)
+        dv = vectorizer.to_dict_vectorizer()
     else:
-        X = dv.transform(dicts)
+        vectorizer = ColumnVectorizer.from_dict_vectorizer(dv, categorical, numerical,
+                                                           value_names=value_names)
+        X = vectorizer.transform(df)
     return X, dv
 
 
@@ -74,9 +81,11 @@ def run_data_prep(raw_data_path: str, dest_path: str, dataset: str = "green"):
 
     # Save DictVectorizer and datasets
     dump_pickle(dv, os.path.join(dest_path, "dv.pkl"))
-    dump_pickle((X_train, y_train), os.path.join(dest_path, "train.pkl"))
-    dump_pickle((X_val, y_val), os.path.join(dest_path, "val.pkl"))
-    dump_pickle((X_test, y_test), os.path.join(dest_path, "test.pkl"))
+    save_dataset(
+        dest_path,
+        {"train": (X_train, y_train), "val": (X_val, y_val), "test": (X_test, y_test)},
+        dv=dv,
+    )
 
 
 if __name__ == '__main__':
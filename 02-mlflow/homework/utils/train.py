@@ -1,16 +1,12 @@
-import os
-import pickle
 import click
 import mlflow
 
 from sklearn.ensemble import RandomForestRegressor
 from sklearn.metrics import mean_squared_error
 
-mlflow.sklearn.autolog()
+from dataset_store import load_dataset
 
-def load_pickle(filename: str):
-    with open(filename, "rb") as f_in:
-        return pickle.load(f_in)
+mlflow.sklearn.autolog()
 
 
 @click.command()
@@ -23,8 +19,8 @@ def load_pickle(filename: str):
 def run_train(data_path: str):
 
     with mlflow.start_run():
-        X_train, y_train = load_pickle(os.path.join(data_path, "train.pkl"))
-        X_val, y_val = load_pickle(os.path.join(data_path, "val.pkl"))
+        X_train, y_train = load_dataset(data_path, "train")
+        X_val, y_val = load_dataset(data_path, "val")
 
         rf = RandomForestRegressor(max_depth=10, random_state=0)
         rf.fit(X_train, y_train)
@@ -7,6 +7,8 @@ import wandb
 
 from sklearn.feature_extraction import DictVectorizer
 
+from trips import read_trips
+
 
 def dump_pickle(obj, filename: str):
     with open(filename, "wb") as f_out:
@@ -14,16 +16,10 @@ def dump_pickle(obj, filename: str):
 
 
 def read_dataframe(filename: str):
-    df = pd.read_parquet(filename)
-
-    df["duration"] = df["lpep_dropoff_datetime"] - df["lpep_pickup_datetime"]
-    df.duration = df.duration.apply(lambda td: td.total_seconds() / 60)
-    df = df[(df.duration >= 1) & (df.duration <= 60)]
-
-    categorical = ["PULocationID", "DOLocationID"]
-    df[categorical] = df[categorical].astype(str)
-
-    return df
+    # Only the columns the features and the target need
+    return read_trips(
+        filename, columns=["trip_distance", "tip_amount"], cast_categorical=True
+    )
 
 
 def preprocess(df: pd.DataFrame, dv: DictVectorizer, fit_dv: bool = False):
@@ -0,0 +1 @@
+../../../shared/trips.py
\ No newline at end of file
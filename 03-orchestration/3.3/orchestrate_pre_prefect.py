@@ -19,7 +19,7 @@ def read_data(filename: str) -> pd.DataFrame:
     df.lpep_pickup_datetime = pd.to_datetime(df.lpep_pickup_datetime)
 
     df["duration"] = df.lpep_dropoff_datetime - df.lpep_pickup_datetime
-    df.duration = df.duration.apply(lambda td: td.total_seconds() / 60)
+    df.duration = df.duration.dt.total_seconds() / 60
 
     df = df[(df.duration >= 1) & (df.duration <= 60)]
 
@@ -0,0 +1 @@
+../../shared/column_vectorizer.py
\ No newline at end of file
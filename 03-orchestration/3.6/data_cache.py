@@ -0,0 +1 @@
+../../shared/data_cache.py
\ No newline at end of file
@@ -4,7 +4,6 @@ import pandas as pd
 import numpy as np
 import scipy
 import sklearn
-from sklearn.feature_extraction import DictVectorizer
 from sklearn.metrics import mean_squared_error
 import mlflow
 import xgboost as xgb
@@ -13,29 +12,23 @@ from prefect_aws import S3Bucket
 from prefect.artifacts import create_markdown_artifact
 from datetime import date
 
+from column_vectorizer import ColumnVectorizer, pair_key, pair_name
+from trips import read_trips
+from data_cache import DataCache, link_into
+
 
 @task(retries=3, retry_delay_seconds=2)
-def read_data(filename: str) -> pd.DataFrame:
+def read_data(filename: str, pair_keys: bool = False) -> pd.DataFrame:
     """Read data into DataFrame"""
-    df = pd.read_parquet(filename)
-
-    df.lpep_dropoff_datetime = pd.to_datetime(df.lpep_dropoff_datetime)
-    df.lpep_pickup_datetime = pd.to_datetime(df.lpep_pickup_datetime)
-
-    df["duration"] = df.lpep_dropoff_datetime - df.lpep_pickup_datetime
-    df.duration = df.duration.apply(lambda td: td.total_seconds() / 60)
-
-    df = df[(df.duration >= 1) & (df.duration <= 60)]
-
-    categorical = ["PULocationID", "DOLocationID"]
-    df[categorical] = df[categorical].astype(str)
-
-    return df
+    # Integer pair keys are built from the numeric ids
+    return read_trips(
+        filename, columns=["trip_distance"], cast_categorical=not pair_keys
+    )
 
 
 @task
 def add_features(
-    df_train: pd.DataFrame, df_val: pd.DataFrame
+    df_train: pd.DataFrame, df_val: pd.DataFrame, pair_keys: bool = False
 ) -> tuple(
     [
         scipy.sparse._csr.csr_matrix,
@@ -46,19 +39,25 @@ def add_features(
     ]
 ):
     """Add features to the model"""
-    df_train["PU_DO"] = df_train["PULocationID"] + "_" + df_train["DOLocationID"]
-    df_val["PU_DO"] = df_val["PULocationID"] + "_" + df_val["DOLocationID"]
+    value_names = {}
+    if pair_keys:
+        # PU * 1000 + DO integers instead of one string per ride, named
+        # "PU_DO=<PU>_<DO>" in the vocabulary like the string features
+        for df in (df_train, df_val):
+            df["PU_DO"] = pair_key(df["PULocationID"], df["DOLocationID"])
+        value_names["PU_DO"] = pair_name
+    else:
+        df_train["PU_DO"] = df_train["PULocationID"] + "_" + df_train["DOLocationID"]
+        df_val["PU_DO"] = df_val["PULocationID"] + "_" + df_val["DOLocationID"]
 
     categorical = ["PU_DO"]  #'PULocationID', 'DOLocationID']
     numerical = ["trip_distance"]
 
-    dv = DictVectorizer()
-
-    train_dicts = df_train[categorical + numerical].to_dict(orient="records")
-    X_train = dv.fit_transform(train_dicts)
-
-    val_dicts = df_val[categorical + numerical].to_dict(orient="records")
-    X_val = dv.transform(val_dicts)
+    # Same matrices as a DictVectorizer on row dicts, built from the columns
+    vectorizer = ColumnVectorizer(categorical, numerical, value_names=value_names)
+    X_train = vectorizer.fit_transform(df_train)
+    X_val = vectorizer.transform(df_val)
+    dv = vectorizer.to_dict_vectorizer()
 
     y_train = df_train["duration"].values
     y_val = df_val["duration"].values
@@ -130,10 +129,34 @@ def train_best_model(
     return None
 
 
+@task
+def sync_folder(s3_bucket_block: S3Bucket, from_folder: str, to_folder: str) -> None:
+    """Mirror an S3 folder locally, only downloading objects that changed"""
+    cache = DataCache()
+    if cache.offline:
+        return  # train on what was synced before
+
+    for obj in s3_bucket_block.list_objects(from_folder):
+        key = obj["Key"]
+        if key.endswith("/"):
+            continue
+        relative_path = pathlib.PurePosixPath(key).relative_to(from_folder)
+        with cache.pinned(
+            f"s3://{s3_bucket_block.bucket_name}/{key}",
+            obj["ETag"].strip('"'),
+            obj["Size"],
+            lambda tmp_path, key=key: s3_bucket_block.download_object_to_path(
+                key, tmp_path
+            ),
+        ) as cached_path:
+            link_into(cached_path, str(pathlib.Path(to_folder, relative_path)))
+
+
 @flow
 def main_flow_s3(
     train_path: str = "./data/green_tripdata_2021-01.parquet",
     val_path: str = "./data/green_tripdata_2021-02.parquet",
+    pair_keys: bool = False,
 ) -> None:
     """The main training pipeline"""
 
@@ -143,13 +166,13 @@ def main_flow_s3(
 
     # Load
     s3_bucket_block = S3Bucket.load("s3-bucket-block")
-    s3_bucket_block.download_folder_to_path(from_folder="data", to_folder="data")
+    sync_folder(s3_bucket_block, from_folder="data", to_folder="data")
 
-    df_train = read_data(train_path)
-    df_val = read_data(val_path)
+    df_train = read_data(train_path, pair_keys)
+    df_val = read_data(val_path, pair_keys)
 
     # Transform
-    X_train, X_val, y_train, y_val, dv = add_features(df_train, df_val)
+    X_train, X_val, y_train, y_val, dv = add_features(df_train, df_val, pair_keys)
 
     # Train
     train_best_model(X_train, X_val, y_train, y_val, dv)
@@ -0,0 +1 @@
+../../shared/ride_scoring.py
\ No newline at end of file
@@ -4,8 +4,8 @@
 
 import os
 import sys
-import uuid
 import logging
+from concurrent.futures import ProcessPoolExecutor, as_completed
 
 import pandas as pd
 import datetime
@@ -15,22 +15,16 @@ import mlflow
 import prefect
 from prefect import flow, task
 
+from data_cache import DataCache
+from ride_scoring import apply_model_streaming, make_result, read_dataframe
+
 # Have to create directory
 # get_ipython().system('mkdir output/green')
 
 logger = logging.getLogger('log_score.log')
 
-def generate_uuids(n):
-    return [str(uuid.uuid4()) for _ in range(n)]
-
-def read_dataframe(filename: str):
-    df = pd.read_parquet(filename)
-    df['duration'] = df.lpep_dropoff_datetime - df.lpep_pickup_datetime
-    df.duration = df.duration.dt.total_seconds() / 60
-    df = df[(df.duration >= 1) & (df.duration <= 60)]
-    df['ride_id'] = generate_uuids(len(df))
-    return df
-
+# Rows per batch in streaming mode, unset scores the whole file at once
+BATCH_SIZE = int(os.getenv('BATCH_SIZE', '0')) or None
 
 def prepare_dictionaries(df: pd.DataFrame):
     categorical = ['PULocationID', 'DOLocationID']
@@ -41,36 +35,39 @@ def prepare_dictionaries(df: pd.DataFrame):
     numerical = ['trip_distance']
     return df[categorical + numerical].to_dict(orient='records')
 
+def model_uri(exp_id, run_id):
+    return f's3://mlops-week4/{exp_id}/{run_id}/artifacts/model'
+
 def load_model(exp_id, run_id):
-    logged_model = logged_model = f's3://mlops-week4/{exp_id}/{run_id}/artifacts/model'
+    logged_model = model_uri(exp_id, run_id)
     return mlflow.pyfunc.load_model(logged_model)
 
-@task
-def apply_model(input_file, run_id, output_file):
+def score_file(input_file, model, run_id, output_file, batch_size=None):
+    if batch_size:
+        logger.info(f'scoring {input_file} in batches of {batch_size} rows to {output_file}')
+        n_rows = apply_model_streaming(input_file, model, run_id, output_file,
+                                       batch_size, prepare_dictionaries)
+        logger.info(f'scored {n_rows} rows')
+        return
+
     logger.info(f'reading the data from {input_file}')
     df = read_dataframe(input_file)
     dict_features = prepare_dictionaries(df)
 
-    logger.info(f'loading the model {run_id}')
-    model = load_model('1', run_id)
-
     logger.info('applying the model...')
     y_pred = model.predict(dict_features)
 
     logger.info(f'saving the results to {output_file}')
-    df_result = pd.DataFrame()
-    df_result['ride_id'] = df['ride_id']
-    df_result['lpep_pickup_datetime'] = df['lpep_pickup_datetime']
-    df_result['lpep_dropoff_datetime'] = df['lpep_dropoff_datetime']
-    df_result['PULocationID'] = df['PULocationID']
-    df_result['DOLocationID'] = df['DOLocationID']
-    df_result['actual_duration'] = df['duration']
-    df_result['predicted_duration'] = y_pred
-    df_result['diff'] = df_result['actual_duration'] - df_result['predicted_duration']
-    df_result['model_version'] = run_id
-
+    df_result = make_result(df, y_pred, run_id)
     df_result.to_parquet(output_file, index=False)
 
+@task
+def apply_model(input_file, run_id, output_file, batch_size=None):
+    logger.info(f'loading the model {run_id}')
+    model = load_model('1', run_id)
+
+    score_file(input_file, model, run_id, output_file, batch_size)
+
 
 def get_path_vars(run_date, taxi_type):
     prev_month = run_date - relativedelta(months=1)
@@ -82,11 +79,75 @@ def get_path_vars(run_date, taxi_type):
     
     return input_file, output_file
 
+def month_range(start_date, end_date):
+    run_dates = []
+    d = start_date
+    while d <= end_date:
+        run_dates.append(d)
+        d += relativedelta(months = 1)
+    return run_dates
+
+# Backfill workers load the model once when their process starts
+worker_model = None
+
+def init_backfill_worker(model_path):
+    global worker_model
+    worker_model = mlflow.pyfunc.load_model(model_path)
+
+def score_month(taxi_type, run_id, run_date, batch_size=None):
+    input_file, output_file = get_path_vars(run_date, taxi_type)
+    os.makedirs(os.path.dirname(output_file), exist_ok=True)
+
+    # Written under a temporary name, so a month that failed half way
+    # is not skipped as done on the next backfill
+    tmp_file = f'{output_file}.tmp'
+    # Pinned, so another worker's download cannot evict it while it is scored
+    with DataCache().pinned(input_file) as input_file:
+        score_file(input_file, worker_model, run_id, tmp_file, batch_size)
+    os.replace(tmp_file, output_file)
+    return output_file
+
+def backfill(taxi_type, run_id, start_date, end_date, max_workers=4, batch_size=None):
+    """
+    Scores every month from start_date to end_date (run dates, as for
+    ride_duration_prediction) on a pool of max_workers processes.
+    Months whose output file already exists are skipped.
+    """
+    todo = []
+    for run_date in month_range(start_date, end_date):
+        _, output_file = get_path_vars(run_date, taxi_type)
+        if os.path.exists(output_file):
+            logger.info(f'skipping {output_file}, already scored')
+        else:
+            todo.append(run_date)
+
+    if not todo:
+        return []
+
+    # Download the model once, the workers load it from local disk
+    logger.info(f'downloading the model {run_id}')
+    model_path = mlflow.artifacts.download_artifacts(artifact_uri=model_uri('1', run_id))
+
+    output_files = []
+    with ProcessPoolExecutor(max_workers=min(max_workers, len(todo)),
+                             initializer=init_backfill_worker,
+                             initargs=(model_path,)) as executor:
+        futures = [
+            executor.submit(score_month, taxi_type, run_id, run_date, batch_size)
+            for run_date in todo
+        ]
+        for future in as_completed(futures):
+            output_file = future.result()
+            logger.info(f'saved {output_file}')
+            output_files.append(output_file)
+    return output_files
+
 @flow
 def ride_duration_prediction(
         taxi_type: str,
         run_id: str,
-        run_date: datetime.datetime = None):
+        run_date: datetime.datetime = None,
+        batch_size: int = BATCH_SIZE):
     if run_date is None:
         ctx = prefect.get_run_context()
         run_date = ctx.flow_run.expected_start_time
@@ -98,9 +159,13 @@ def ride_duration_prediction(
     if not isExist:
         os.makedirs(path)
     
-    apply_model(input_file, 
-                run_id, 
-                output_file)
+    # Downloaded once per remote version, see DATA_CACHE_* in data_cache.py,
+    # and kept from eviction while it is scored
+    with DataCache().pinned(input_file) as input_file:
+        apply_model(input_file, 
+                    run_id, 
+                    output_file,
+                    batch_size)
 
 
 def run():
@@ -108,11 +173,13 @@ def run():
     year = int(sys.argv[2]) # 2021
     month = int(sys.argv[3]) # 3
     run_id = sys.argv[4] # '602e2fa2a0df4f5a87eef98f93b79090'
+    batch_size = int(sys.argv[5]) if len(sys.argv) > 5 else BATCH_SIZE # 100000
 
     ride_duration_prediction(
         taxi_type=taxi_type,
         run_id=run_id,
-        run_date = datetime.datetime(year=year, month=month, day=1)
+        run_date = datetime.datetime(year=year, month=month, day=1),
+        batch_size=batch_size
     )
     
 
@@ -1,27 +1,21 @@
 from datetime import datetime
-from dateutil.relativedelta import relativedelta
 
 from prefect import flow
 from prefect.deployments import Deployment
 from prefect.server.schemas.schedules import CronSchedule
 
-from score import ride_duration_prediction
+from score import BATCH_SIZE, backfill
 
 @flow
-def ride_duration_prediction_backfill():
-    start_date = datetime(year=2022, month = 3, day = 1)
-    end_date = datetime(year=2022, month = 4, day = 1)
-    
-    d = start_date
-    
-    while d <= end_date:
-        ride_duration_prediction(
-            taxi_type='green',
-            run_id = '602e2fa2a0df4f5a87eef98f93b79090',
-            run_date = d
-        )
-        
-        d += relativedelta(months = 1)
+def ride_duration_prediction_backfill(
+        taxi_type: str = 'green',
+        run_id: str = '602e2fa2a0df4f5a87eef98f93b79090',
+        start_date: datetime = datetime(year=2022, month = 3, day = 1),
+        end_date: datetime = datetime(year=2022, month = 4, day = 1),
+        max_workers: int = 4,
+        batch_size: int = BATCH_SIZE):
+    # Months run concurrently, each worker process loads the model once
+    backfill(taxi_type, run_id, start_date, end_date, max_workers, batch_size)
 
 deployment = Deployment.build_from_flow(
     flow=ride_duration_prediction_backfill,
@@ -0,0 +1 @@
+../../shared/ride_ids.py
\ No newline at end of file
@@ -18,36 +18,37 @@ from sklearn.pipeline import make_pipeline
 
 import pathlib
 
-import uuid
+from column_vectorizer import ColumnVectorizer, pair_key, pair_name
+from data_cache import DataCache
+from ride_scoring import apply_model_streaming, make_result, read_dataframe
+
+# Rows per batch in streaming mode, unset scores the whole file at once
+BATCH_SIZE = int(os.getenv('BATCH_SIZE', '0')) or None
 
 # Have to create directory
 # get_ipython().system('mkdir output/green')
 
-def generate_uuids(n):
-    ride_ids = []
-    # Create Ride IDs with UUID
-    for i in range(n):
-        ride_ids.append(str(uuid.uuid4()))
-    return ride_ids
-
-def read_dataframe(filename: str):
-    df = pd.read_parquet(filename)
-    df['duration'] = df.lpep_dropoff_datetime - df.lpep_pickup_datetime
-    df.duration = df.duration.dt.total_seconds() / 60
-    df = df[(df.duration >= 1) & (df.duration <= 60)]
-    df['ride_id'] = generate_uuids(len(df))
-    return df
-
-
-def prepare_dictionaries(df: pd.DataFrame):
-    categorical = ['PULocationID', 'DOLocationID']
-    df[categorical] = df[categorical].astype(str)
-    
-    df['PU_DO'] = df['PULocationID'] + '_' + df['DOLocationID']
-    categorical = ['PU_DO']
-    numerical = ['trip_distance']
-    dicts = df[categorical + numerical].to_dict(orient='records')
-    return dicts
+CATEGORICAL = ['PU_DO']
+NUMERICAL = ['trip_distance']
+
+
+def prepare_features(df: pd.DataFrame):
+    # PU * 1000 + DO integers instead of one 'PU_DO' string per ride
+    df['PU_DO'] = pair_key(df['PULocationID'], df['DOLocationID'])
+    return df[CATEGORICAL + NUMERICAL]
+
+
+class ColumnarModel:
+    # DictVectorizer + regressor pipeline, scored from the feature columns
+    # instead of one dict per ride
+
+    def __init__(self, pipeline):
+        dv, self.model = [step for _, step in pipeline.steps]
+        self.vectorizer = ColumnVectorizer.from_dict_vectorizer(
+            dv, CATEGORICAL, NUMERICAL, value_names={'PU_DO': pair_name})
+
+    def predict(self, features: pd.DataFrame):
+        return self.model.predict(self.vectorizer.transform(features))
 
 
 # In[9]:
@@ -55,33 +56,33 @@ def prepare_dictionaries(df: pd.DataFrame):
 
 def load_model(exp_id, run_id):
     logged_model = logged_model = f's3://mlops-week4/{exp_id}/{run_id}/artifacts/model'
-    model = mlflow.pyfunc.load_model(logged_model)
-    return model
+    pipeline = mlflow.sklearn.load_model(logged_model)
+    return ColumnarModel(pipeline)
+
 
+def apply_model(input_file, run_id, output_file, batch_size=None):
+    if batch_size:
+        print(f'loading the model {run_id}')
+        model = load_model('1', run_id)
+
+        print(f'scoring {input_file} in batches of {batch_size} rows to {output_file}')
+        n_rows = apply_model_streaming(input_file, model, run_id, output_file,
+                                       batch_size, prepare_features)
+        print(f'scored {n_rows} rows')
+        return
 
-def apply_model(input_file, run_id, output_file):
     print(f'reading the data from {input_file}')
     df = read_dataframe(input_file)
-    dict_features = prepare_dictionaries(df)
+    features = prepare_features(df)
     
     print(f'loading the model {run_id}')
     model = load_model('1', run_id)
     
     print(f'applying the model...')
-    y_pred = model.predict(dict_features)
+    y_pred = model.predict(features)
     
     print(f'saving the results to {output_file}')
-    df_result = pd.DataFrame()
-    df_result['ride_id'] = df['ride_id']
-    df_result['lpep_pickup_datetime'] = df['lpep_pickup_datetime']
-    df_result['lpep_dropoff_datetime'] = df['lpep_dropoff_datetime']
-    df_result['PULocationID'] = df['PULocationID']
-    df_result['DOLocationID'] = df['DOLocationID']
-    df_result['actual_duration'] = df['duration']
-    df_result['predicted_duration'] = y_pred
-    df_result['diff'] = df_result['actual_duration'] - df_result['predicted_duration']
-    df_result['model_version'] = run_id
-    
+    df_result = make_result(df, y_pred, run_id)
     df_result.to_parquet(output_file, index=False)
 
 
@@ -90,13 +91,18 @@ def run():
     year = int(sys.argv[2]) # 2021
     month = int(sys.argv[3]) # 3
     RUN_ID = sys.argv[4] # '602e2fa2a0df4f5a87eef98f93b79090'
+    batch_size = int(sys.argv[5]) if len(sys.argv) > 5 else BATCH_SIZE # 100000
 
     input_file = f'https://d37ci6vzurychx.cloudfront.net/trip-data/{taxi_type}_tripdata_{year:04d}-{month:02d}.parquet'
     output_file = f'output/{taxi_type}/{year:04d}-{month:02d}.parquet'
 
-    apply_model(input_file, 
-                RUN_ID, 
-                output_file)
+    # Downloaded once per remote version, see DATA_CACHE_* in data_cache.py,
+    # and kept from eviction while it is scored
+    with DataCache().pinned(input_file) as input_file:
+        apply_model(input_file, 
+                    RUN_ID, 
+                    output_file,
+                    batch_size)
 
 
 if __name__ == '__main__':
@@ -0,0 +1,79 @@
+import numpy as np
+import pandas as pd
+from sklearn.feature_extraction import DictVectorizer
+
+from column_vectorizer import ColumnVectorizer, pair_key, pair_name
+
+CATEGORICAL = ['PU_DO']
+NUMERICAL = ['trip_distance']
+
+
+def make_rides(n_rides, seed, n_locations=20):
+    rng = np.random.default_rng(seed)
+    return pd.DataFrame({
+        'PULocationID': rng.integers(1, n_locations, n_rides),
+        'DOLocationID': rng.integers(1, n_locations, n_rides),
+        'trip_distance': rng.uniform(0.1, 20.0, n_rides),
+    })
+
+
+def with_pair_names(df):
+    df = df.copy()
+    df['PU_DO'] = df['PULocationID'].astype(str) + '_' + df['DOLocationID'].astype(str)
+    return df
+
+
+def dicts(df):
+    return df[CATEGORICAL + NUMERICAL].to_dict(orient='records')
+
+
+def fitted_dv(df):
+    dv = DictVectorizer()
+    dv.fit(dicts(with_pair_names(df)))
+    return dv
+
+
+def unseen_rides():
+    # Locations outside the training range and missing distances
+    rides = make_rides(200, seed=1, n_locations=40)
+    rides.loc[::7, 'trip_distance'] = np.nan
+    return rides
+
+
+def assert_same_matrix(actual, expected):
+    assert actual.shape == expected.shape
+    np.testing.assert_array_equal(actual.toarray(), expected.toarray())
+
+
+def test_fit_matches_dict_vectorizer():
+    train = with_pair_names(make_rides(500, seed=0))
+    dv = DictVectorizer().fit(dicts(train))
+
+    vectorizer = ColumnVectorizer(CATEGORICAL, NUMERICAL).fit(train)
+
+    assert vectorizer.feature_names_ == list(dv.feature_names_)
+    assert_same_matrix(vectorizer.transform(train), dv.transform(dicts(train)))
+
+
+def test_string_keys_match_dict_vectorizer():
+    dv = fitted_dv(make_rides(500, seed=0))
+    rides = with_pair_names(unseen_rides())
+
+    vectorizer = ColumnVectorizer.from_dict_vectorizer(dv, CATEGORICAL, NUMERICAL)
+
+    assert_same_matrix(vectorizer.transform(rides), dv.transform(dicts(rides)))
+
+
+def test_pair_keys_match_dict_vectorizer():
+    dv = fitted_dv(make_rides(500, seed=0))
+    rides = unseen_rides()
+
+    vectorizer = ColumnVectorizer.from_dict_vectorizer(
+        dv, CATEGORICAL, NUMERICAL, value_names={'PU_DO': pair_name})
+    features = pd.DataFrame({
+        'PU_DO': pair_key(rides['PULocationID'], rides['DOLocationID']),
+        'trip_distance': rides['trip_distance'],
+    })
+
+    expected = dv.transform(dicts(with_pair_names(rides)))
+    assert_same_matrix(vectorizer.transform(features), expected)
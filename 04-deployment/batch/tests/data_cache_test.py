@@ -0,0 +1,124 @@
+import os
+import functools
+import threading
+import http.server
+
+import pytest
+
+from data_cache import DataCache
+
+URL = 'https://example.com/trip-data/green_tripdata_2021-03.parquet'
+
+
+class FakeDownload:
+    # Writes content to the temporary path, counting the downloads
+    def __init__(self, content=b'rides'):
+        self.content = content
+        self.calls = 0
+
+    def __call__(self, tmp_path):
+        self.calls += 1
+        with open(tmp_path, 'wb') as f_out:
+            f_out.write(self.content)
+
+
+def test_get_downloads_once(tmp_path):
+    cache = DataCache(cache_dir=str(tmp_path))
+    download = FakeDownload()
+
+    path = cache.get(URL, 'v1', 5, download)
+    assert cache.get(URL, 'v1', 5, download) == path
+    assert download.calls == 1
+    with open(path, 'rb') as f_in:
+        assert f_in.read() == b'rides'
+
+    # A new remote version is a new entry
+    assert cache.get(URL, 'v2', 5, download) != path
+    assert download.calls == 2
+
+
+def test_pinned_entry_survives_eviction(tmp_path):
+    cache = DataCache(cache_dir=str(tmp_path), max_bytes=0)
+
+    with cache.pinned(URL, 'v1', 5, FakeDownload()) as path:
+        # Adding another entry evicts everything over max_bytes=0
+        other = cache.get(f'{URL}.other', 'v1', 5, FakeDownload())
+        assert os.path.exists(path)
+        assert os.path.exists(other)
+
+    cache.evict()
+    assert not os.path.exists(path)
+    assert not os.path.exists(other)
+
+
+def test_remove_refuses_pinned_entry(tmp_path):
+    cache = DataCache(cache_dir=str(tmp_path))
+
+    with cache.pinned(URL, 'v1', 5, FakeDownload()) as path:
+        key = os.path.basename(os.path.dirname(path))
+        assert cache.remove(key) is False
+        assert os.path.exists(path)
+
+    assert cache.remove(key) is True
+    assert not os.path.exists(path)
+
+
+def test_evict_skips_pinned_entries(tmp_path):
+    cache = DataCache(cache_dir=str(tmp_path))
+    unpinned = cache.get(f'{URL}.old', 'v1', 5, FakeDownload())
+
+    with cache.pinned(URL, 'v1', 5, FakeDownload()) as pinned:
+        # The pinned entry is the older one, so it would go first
+        os.utime(os.path.join(os.path.dirname(pinned), 'meta.json'), (0, 0))
+        cache.max_bytes = 0
+        cache.evict()
+        assert os.path.exists(pinned)
+        assert not os.path.exists(unpinned)
+
+
+def test_get_again_after_eviction(tmp_path):
+    cache = DataCache(cache_dir=str(tmp_path))
+    download = FakeDownload()
+
+    path = cache.get(URL, 'v1', 5, download)
+    cache.remove(os.path.basename(os.path.dirname(path)))
+
+    with cache.pinned(URL, 'v1', 5, download) as pinned:
+        assert pinned == path
+        assert os.path.exists(pinned)
+    assert download.calls == 2
+
+
+def test_offline_lookup(tmp_path):
+    DataCache(cache_dir=str(tmp_path)).get(URL, 'v1', 5, FakeDownload(b'old'))
+    newest = DataCache(cache_dir=str(tmp_path)).get(URL, 'v2', 5, FakeDownload(b'new'))
+
+    offline = DataCache(cache_dir=str(tmp_path), offline=True)
+    assert offline.fetch(URL) == newest
+    with pytest.raises(FileNotFoundError):
+        offline.fetch(f'{URL}.missing')
+
+
+def test_fetch_http(tmp_path):
+    served = tmp_path / 'served'
+    served.mkdir()
+    (served / 'rides.parquet').write_bytes(b'rides')
+
+    handler = functools.partial(http.server.SimpleHTTPRequestHandler, directory=str(served))
+    server = http.server.ThreadingHTTPServer(('127.0.0.1', 0), handler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    url = f'http://127.0.0.1:{server.server_port}/rides.parquet'
+
+    cache = DataCache(cache_dir=str(tmp_path / 'cache'))
+    try:
+        path = cache.fetch(url)
+        assert cache.fetch(url) == path
+    finally:
+        server.shutdown()
+        server.server_close()
+
+    with open(path, 'rb') as f_in:
+        assert f_in.read() == b'rides'
+    # Server gone: the cached copy is used
+    assert cache.fetch(url) == path
@@ -0,0 +1,73 @@
+import datetime
+
+import numpy as np
+import pandas as pd
+import pyarrow.parquet as pq
+
+import ride_ids
+import ride_scoring
+import score
+
+
+class ZeroModel:
+    def predict(self, features):
+        return np.zeros(len(features))
+
+
+def write_rides(path, n_rides=1000, n_copies=5, minutes=10):
+    # n_copies identical copies of every ride, spread over the whole file
+    pickup = datetime.datetime(2021, 3, 1) + pd.to_timedelta(np.arange(n_rides), unit='min')
+    rides = pd.DataFrame({
+        'lpep_pickup_datetime': pickup,
+        'lpep_dropoff_datetime': pickup + datetime.timedelta(minutes=minutes),
+        'PULocationID': np.arange(n_rides) % 7,
+        'DOLocationID': np.arange(n_rides) % 11,
+        'trip_distance': 2.5,
+    })
+    pd.concat([rides] * n_copies, ignore_index=True).to_parquet(path, index=False)
+    return n_rides * n_copies
+
+
+def test_hash_uuids_halves_differ():
+    rides = pd.DataFrame({col: [1.0, 2.0] for col in ride_scoring.RIDE_ID_COLUMNS})
+    ids = ride_ids.hash_uuids(rides, np.arange(2), ride_scoring.RIDE_ID_COLUMNS)
+
+    for ride_id in ids:
+        digits = ride_id.replace('-', '')
+        assert digits[:16] != digits[16:]
+        assert ride_id[14] == '8'
+
+
+def test_ride_ids_unique_across_batches(tmp_path, monkeypatch):
+    monkeypatch.setattr(ride_ids, 'DETERMINISTIC_RIDE_IDS', True)
+    input_file = str(tmp_path / 'rides.parquet')
+    n_rows = write_rides(input_file)
+
+    expected = ride_scoring.read_dataframe(input_file)['ride_id']
+
+    output_file = str(tmp_path / 'scored.parquet')
+    ride_scoring.apply_model_streaming(input_file, ZeroModel(), 'run', output_file,
+                                       batch_size=333, prepare=score.prepare_features)
+    actual = pd.read_parquet(output_file)['ride_id']
+
+    assert expected.nunique() == n_rows
+    assert actual.tolist() == expected.tolist()
+
+
+def test_streaming_writes_empty_result(tmp_path):
+    # Every ride is longer than 60 minutes, so nothing is left to score
+    input_file = str(tmp_path / 'rides.parquet')
+    write_rides(input_file, minutes=90)
+    scored_file = str(tmp_path / 'scored.parquet')
+    write_rides(str(tmp_path / 'ok.parquet'))
+    ride_scoring.apply_model_streaming(str(tmp_path / 'ok.parquet'), ZeroModel(), 'run',
+                                       scored_file, 333, score.prepare_features)
+
+    output_file = str(tmp_path / 'empty.parquet')
+    ride_scoring.apply_model_streaming(input_file, ZeroModel(), 'run', output_file,
+                                       batch_size=333, prepare=score.prepare_features)
+
+    empty = pq.read_table(output_file)
+    assert empty.num_rows == 0
+    assert empty.schema.equals(pq.read_schema(scored_file))
+    assert pd.api.types.is_string_dtype(pd.read_parquet(scored_file)['PULocationID'])
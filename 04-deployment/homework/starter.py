@@ -7,6 +7,8 @@ import boto3
 import sys
 from io import BytesIO
 from dotenv import load_dotenv
+from trips import read_trips
+from data_cache import DataCache
 load_dotenv(os.path.join(os.path.dirname(__file__), '.env'))
 
 
@@ -20,20 +22,19 @@ s3 = boto3.client('s3',
                 )
 
 def read_data(filename):
-    df = pd.read_parquet(filename)
-
-    df['duration'] = df.tpep_dropoff_datetime - df.tpep_pickup_datetime
-    df['duration'] = df.duration.dt.total_seconds() / 60
-
-    df = df[(df.duration >= 1) & (df.duration <= 60)].copy()
-
     categorical = ['PULocationID', 'DOLocationID']
+    # Only the location ids are read, and the 1-60 minute duration filter
+    # runs inside the parquet scan
+    df = read_trips(filename, columns=categorical, min_duration=1, max_duration=60)
+
     df[categorical] = df[categorical].fillna(-1).astype('int').astype('str')
     return df[categorical].to_dict(orient='records')
 
 
 def make_preds(taxi_type, year, month):
-    dicts = read_data(f'https://d37ci6vzurychx.cloudfront.net/trip-data/{taxi_type}_tripdata_{year:04d}-{month:02d}.parquet')
+    input_file = f'https://d37ci6vzurychx.cloudfront.net/trip-data/{taxi_type}_tripdata_{year:04d}-{month:02d}.parquet'
+    with DataCache().pinned(input_file) as local_file:
+        dicts = read_data(local_file)
     X_val = dv.transform(dicts)
     return model.predict(X_val)
 
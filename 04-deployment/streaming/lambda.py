@@ -5,6 +5,11 @@ import base64
 
 import mlflow
 
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
 kinesis_client = boto3.client('kinesis')
 
 PREDICTIONS_STREAM_NAME = os.getenv('PREDICTIONS_STREAM_NAME', 'ride_predictions')
@@ -19,6 +24,29 @@ model = mlflow.pyfunc.load_model(logged_model)
 
 TEST_RUN = os.getenv('TEST_RUN', 'False') == 'True'
 
+RIDE_FIELDS = ('PULocationID', 'DOLocationID', 'trip_distance')
+
+def decode_record(encoded_data):
+    # Parse the raw bytes directly, no intermediate str
+    decoded_data = base64.b64decode(encoded_data)
+    if orjson is not None:
+        return orjson.loads(decoded_data)
+    return json.loads(decoded_data)
+
+
+def validate_ride_event(ride_event):
+    if not isinstance(ride_event, dict) or 'ride_id' not in ride_event:
+        raise ValueError('ride_id is missing')
+
+    ride = ride_event.get('ride')
+    if not isinstance(ride, dict):
+        raise ValueError('ride is missing')
+
+    missing = [field for field in RIDE_FIELDS if field not in ride]
+    if missing:
+        raise ValueError(f'ride is missing fields: {missing}')
+
+
 def prepare_features(ride):
     features = {}
     features['PU_DO'] = '%s_%s' % (ride['PULocationID'], ride['DOLocationID'])
@@ -35,16 +63,19 @@ def lambda_handler(event, context):
     # print(json.dumps(event))
     
     predictions_events = []
+    dead_letters = []
     
     for record in event['Records']:
-        encoded_data = record['kinesis']['data']
-        decoded_data = base64.b64decode(encoded_data).decode('utf-8')
-        ride_event = json.loads(decoded_data)
+        try:
+            ride_event = decode_record(record['kinesis']['data'])
+            validate_ride_event(ride_event)
+        except (KeyError, TypeError, ValueError) as error:
+            # Skip malformed records instead of failing the whole batch
+            dead_letters.append({'record': record, 'error': str(error)})
+            continue
 
-        # print(ride_event)
         ride = ride_event['ride']
         ride_id = ride_event['ride_id']
-    
         features = prepare_features(ride)
         prediction = predict(features)
     
@@ -67,6 +98,9 @@ def lambda_handler(event, context):
         predictions_events.append(prediction_event)
 
 
-    return {
+    result = {
         'predictions': predictions_events
-    }
\ No newline at end of file
+    }
+    if dead_letters:
+        result['dead_letters'] = dead_letters
+    return result
\ No newline at end of file
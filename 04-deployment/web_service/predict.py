@@ -1,11 +1,141 @@
+import os
+import json
 import pickle
 import pathlib
-from flask import Flask, request, jsonify
+import itertools
+import numpy as np
+from flask import Flask, Response, request, jsonify
+
+COMPILED_SCORING = os.getenv('COMPILED_SCORING', 'True') == 'True'
+MAX_BATCH_SIZE = int(os.getenv('MAX_BATCH_SIZE', '10000'))
+# Set by serve.py: workers map the model arrays instead of unpickling lin_reg.bin
+MODEL_ARRAYS_DIR = os.getenv('MODEL_ARRAYS_DIR')
+RIDE_FIELDS = ('PULocationID', 'DOLocationID', 'trip_distance')
+
+
+# The linear model as a dense table: base[PU, DO] = intercept + coef[PU_DO],
+# so a prediction is base[PU, DO] + coef_distance * trip_distance.
+# Pairs missing from the vocabulary get the intercept, like DictVectorizer.
+class CompiledLinearModel:
+    def __init__(self, base, coef_distance):
+        self.base = base
+        self.coef_distance = coef_distance
+
+    @classmethod
+    def from_pipeline(cls, dv, model):
+        coef = np.ravel(model.coef_)
+        intercept = float(np.ravel(model.intercept_)[0])
+
+        pairs = {}
+        coef_distance = 0.0
+        for index, name in enumerate(dv.feature_names_):
+            if name == 'trip_distance':
+                coef_distance = float(coef[index])
+            elif name.startswith('PU_DO='):
+                pu, do = name[len('PU_DO='):].split('_')
+                pairs[int(pu), int(do)] = coef[index]
+            else:
+                raise ValueError(f'Cannot compile feature {name}')
+
+        size = max(max(pair) for pair in pairs) + 1 if pairs else 1
+        base = np.full((size, size), intercept)
+        for (pu, do), value in pairs.items():
+            base[pu, do] += value
+        return cls(base, coef_distance)
+
+    @classmethod
+    def try_from_pipeline(cls, dv, model):
+        # None when the vocabulary has features the table cannot represent
+        try:
+            return cls.from_pipeline(dv, model)
+        except ValueError:
+            return None
+
+    def predict(self, ride):
+        # None means the ride has to go through dv + model instead
+        pu, do = ride['PULocationID'], ride['DOLocationID']
+        distance = ride['trip_distance']
+        # type() rather than isinstance(), so True/False do not index the table
+        if not (type(pu) is int and type(do) is int):
+            return None
+        if type(distance) not in (int, float):
+            return None
+        if not (0 <= pu < len(self.base) and 0 <= do < len(self.base)):
+            return None
+        return float(self.base[pu, do] + self.coef_distance * distance)
+
+
+# dv + linear model as plain numpy arrays. serve.py saves them once and every
+# worker loads them with mmap_mode='r', so all processes share the same pages.
+class SharedLinearModel:
+    def __init__(self, feature_names, coef, intercept):
+        # DictVectorizer keeps feature_names_ sorted, so lookups are a binary search
+        self.feature_names = feature_names
+        self.coef = coef
+        self.intercept = intercept
+
+    @staticmethod
+    def save(dv, model, arrays_dir):
+        arrays = {
+            'feature_names': np.array(dv.feature_names_, dtype=str),
+            'coef': np.ravel(model.coef_).astype(np.float64),
+            'intercept': np.array(np.ravel(model.intercept_)[0], dtype=np.float64),
+        }
+        # The lookup table only exists for models it can represent
+        compiled = CompiledLinearModel.try_from_pipeline(dv, model)
+        if compiled is not None:
+            arrays['base'] = compiled.base
+            arrays['coef_distance'] = np.array(compiled.coef_distance)
+        for name, array in arrays.items():
+            np.save(os.path.join(arrays_dir, f'{name}.npy'), array)
+
+    @staticmethod
+    def load_arrays(arrays_dir):
+        return {
+            name: np.load(os.path.join(arrays_dir, f'{name}.npy'), mmap_mode='r')
+            for name in ('feature_names', 'coef', 'intercept', 'base', 'coef_distance')
+            if os.path.exists(os.path.join(arrays_dir, f'{name}.npy'))
+        }
+
+    def feature_index(self, name):
+        index = np.searchsorted(self.feature_names, name)
+        if index < len(self.feature_names) and self.feature_names[index] == name:
+            return index
+        return None
+
+    def predict(self, features):
+        if isinstance(features, dict):
+            features = [features]
+
+        preds = np.full(len(features), float(self.intercept))
+        for i, row in enumerate(features):
+            for key, value in row.items():
+                if isinstance(value, str):
+                    key, value = f'{key}={value}', 1.0
+                index = self.feature_index(key)
+                if index is not None:
+                    preds[i] += self.coef[index] * value
+        return preds
+
 
 # Need to load in the model we've created
 
-with open('lin_reg.bin', 'rb') as f_in:
-    (dv, model) = pickle.load(f_in)
+if MODEL_ARRAYS_DIR:
+    dv, model = None, None
+    arrays = SharedLinearModel.load_arrays(MODEL_ARRAYS_DIR)
+    shared_model = SharedLinearModel(
+        arrays['feature_names'], arrays['coef'], arrays['intercept']
+    )
+    compiled_model = None
+    if COMPILED_SCORING and 'base' in arrays:
+        compiled_model = CompiledLinearModel(arrays['base'], float(arrays['coef_distance']))
+else:
+    with open('lin_reg.bin', 'rb') as f_in:
+        (dv, model) = pickle.load(f_in)
+    shared_model = None
+    compiled_model = None
+    if COMPILED_SCORING:
+        compiled_model = CompiledLinearModel.try_from_pipeline(dv, model)
 
 
 def prepare_features(ride):
@@ -16,18 +146,39 @@ def prepare_features(ride):
 
     
 def predict(features):
+    if shared_model is not None:
+        return shared_model.predict(features)[0]
     X = dv.transform(features)
     return model.predict(X)[0]
 
 
+def predict_batch(rides):
+    # One dv.transform + model.predict for all rides
+    if not rides:
+        return []
+    features = [prepare_features(ride) for ride in rides]
+    if shared_model is not None:
+        return shared_model.predict(features).tolist()
+    X = dv.transform(features)
+    return model.predict(X).tolist()
+
+
+def predict_ride(ride):
+    if compiled_model is not None:
+        pred = compiled_model.predict(ride)
+        if pred is not None:
+            return pred
+    features = prepare_features(ride)
+    return predict(features)
+
+
 
 app = Flask('duration-prediction')
 # Decorator to create an endpoint
 @app.route('/predict', methods=["POST"])
 def predict_endpoint():
     ride = request.get_json()    
-    features = prepare_features(ride)
-    pred = predict(features)
+    pred = predict_ride(ride)
 
     result = {
         'duration':pred
@@ -36,6 +187,48 @@ def predict_endpoint():
     return jsonify(result)
 
 
+def is_valid_ride(ride):
+    return isinstance(ride, dict) and all(field in ride for field in RIDE_FIELDS)
+
+
+def is_ndjson():
+    return request.mimetype == 'application/x-ndjson'
+
+
+def read_rides():
+    # JSON array, or one ride per line for application/x-ndjson.
+    # Reads at most MAX_BATCH_SIZE + 1 rides so oversized batches are caught early.
+    if is_ndjson():
+        lines = (line for line in request.stream if line.strip())
+        return [json.loads(line) for line in itertools.islice(lines, MAX_BATCH_SIZE + 1)]
+    return request.get_json()
+
+
+@app.route('/predict_batch', methods=["POST"])
+def predict_batch_endpoint():
+    try:
+        rides = read_rides()
+    except ValueError:
+        return jsonify({'error': 'invalid JSON'}), 400
+
+    if not isinstance(rides, list):
+        return jsonify({'error': 'expected a list of rides'}), 400
+    if len(rides) > MAX_BATCH_SIZE:
+        return jsonify({'error': f'batch larger than {MAX_BATCH_SIZE} rides'}), 413
+    if not all(is_valid_ride(ride) for ride in rides):
+        return jsonify({'error': f'every ride needs {RIDE_FIELDS}'}), 400
+
+    preds = predict_batch(rides)
+
+    if is_ndjson():
+        def generate():
+            for pred in preds:
+                yield json.dumps({'duration': pred}) + '\n'
+        return Response(generate(), mimetype='application/x-ndjson')
+
+    return jsonify([{'duration': pred} for pred in preds])
+
+
 # Shutdown Server
 def shutdown_server():
     func = request.environ.get('werkzeug.server.shutdown')
@@ -0,0 +1,120 @@
+import os
+import asyncio
+
+from starlette.routing import Route
+from starlette.responses import JSONResponse
+from starlette.applications import Starlette
+from starlette.concurrency import run_in_threadpool
+
+# Same model and scoring functions as the Flask app
+import predict
+
+# ASGI version of predict.py, run with:
+# uvicorn --host 0.0.0.0 --port 9696 predict_async:app
+
+COALESCE_WAIT_MS = float(os.getenv('COALESCE_WAIT_MS', '5'))
+COALESCE_MAX_BATCH = int(os.getenv('COALESCE_MAX_BATCH', '256'))
+RIDE_FIELDS = ('PULocationID', 'DOLocationID', 'trip_distance')
+
+
+class RequestCoalescer:
+    # Gathers single-ride requests arriving within max_wait seconds of each
+    # other into one predict_batch call, then resolves each waiting request
+
+    def __init__(self, predict_batch, max_wait=0.005, max_batch_size=256):
+        self.predict_batch = predict_batch
+        self.max_wait = max_wait
+        self.max_batch_size = max_batch_size
+        self.queue = None
+        self.worker = None
+
+    async def predict(self, ride):
+        if self.worker is None or self.worker.done():
+            self.queue = asyncio.Queue()
+            self.worker = asyncio.create_task(self.run())
+
+        future = asyncio.get_running_loop().create_future()
+        await self.queue.put((ride, future))
+        return await future
+
+    async def next_batch(self):
+        loop = asyncio.get_running_loop()
+        batch = [await self.queue.get()]
+        deadline = loop.time() + self.max_wait
+
+        while len(batch) < self.max_batch_size:
+            timeout = deadline - loop.time()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self.queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    async def run(self):
+        while True:
+            batch = await self.next_batch()
+            rides = [ride for ride, _ in batch]
+
+            try:
+                # Off the event loop so requests keep queueing meanwhile
+                preds = await run_in_threadpool(self.predict_batch, rides)
+            except Exception as e:  # pylint: disable=broad-except
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+
+            for (_, future), pred in zip(batch, preds):
+                if not future.done():
+                    future.set_result(pred)
+
+
+coalescer = RequestCoalescer(
+    predict.predict_batch,
+    max_wait=COALESCE_WAIT_MS / 1000,
+    max_batch_size=COALESCE_MAX_BATCH,
+)
+
+
+def is_valid_ride(ride):
+    return isinstance(ride, dict) and all(field in ride for field in RIDE_FIELDS)
+
+
+async def read_json(request):
+    try:
+        return await request.json()
+    except ValueError:
+        return None
+
+
+async def predict_endpoint(request):
+    ride = await read_json(request)
+    if not is_valid_ride(ride):
+        return JSONResponse({'error': f'ride needs {RIDE_FIELDS}'}, status_code=400)
+
+    pred = await coalescer.predict(ride)
+    return JSONResponse({'duration': pred})
+
+
+async def predict_batch_endpoint(request):
+    rides = await read_json(request)
+    if not isinstance(rides, list) or not all(is_valid_ride(ride) for ride in rides):
+        return JSONResponse({'error': 'expected a list of rides'}, status_code=400)
+    if len(rides) > predict.MAX_BATCH_SIZE:
+        return JSONResponse(
+            {'error': f'batch larger than {predict.MAX_BATCH_SIZE} rides'},
+            status_code=413,
+        )
+
+    preds = await run_in_threadpool(predict.predict_batch, rides)
+    return JSONResponse([{'duration': pred} for pred in preds])
+
+
+app = Starlette(
+    routes=[
+        Route('/predict', predict_endpoint, methods=['POST']),
+        Route('/predict_batch', predict_batch_endpoint, methods=['POST']),
+    ]
+)
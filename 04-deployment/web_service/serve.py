@@ -0,0 +1,38 @@
+import os
+import shutil
+import signal
+import tempfile
+import subprocess
+
+import predict
+
+# Pre-fork launcher: lin_reg.bin is loaded once here (by importing predict),
+# its arrays are written to shared memory (/dev/shm) and the gunicorn workers
+# mmap them read-only instead of each unpickling their own copy of the model.
+
+WORKERS = int(os.getenv('WORKERS', str(os.cpu_count() or 1)))
+BIND = os.getenv('BIND', '0.0.0.0:9696')
+
+
+def export_arrays(arrays_dir):
+    predict.SharedLinearModel.save(predict.dv, predict.model, arrays_dir)
+
+
+def main():
+    shm_dir = '/dev/shm' if os.path.isdir('/dev/shm') else None
+    arrays_dir = tempfile.mkdtemp(prefix='duration-model-', dir=shm_dir)
+
+    try:
+        export_arrays(arrays_dir)
+        env = dict(os.environ, MODEL_ARRAYS_DIR=arrays_dir)
+        command = ['gunicorn', f'--workers={WORKERS}', f'--bind={BIND}', 'predict:app']
+        with subprocess.Popen(command, env=env) as process:
+            # Pass docker stop / SIGTERM on to gunicorn, then clean up below
+            signal.signal(signal.SIGTERM, lambda *_: process.terminate())
+            process.wait()
+    finally:
+        shutil.rmtree(arrays_dir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
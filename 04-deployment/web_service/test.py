@@ -9,3 +9,10 @@ ride = {
 url = 'http://localhost:9696/predict'
 response = requests.post(url, json=ride)
 print(response.json())
+
+
+rides = [ride, {'PULocationID': 130, 'DOLocationID': 205, 'trip_distance': 3.66}]
+
+url = 'http://localhost:9696/predict_batch'
+response = requests.post(url, json=rides)
+print(response.json())
@@ -5,11 +5,15 @@ import model
 PREDICTIONS_STREAM_NAME = os.getenv('PREDICTIONS_STREAM_NAME', 'ride_predictions')
 RUN_ID = os.getenv('RUN_ID')
 TEST_RUN = os.getenv('TEST_RUN', 'False') == 'True'
+CALLBACK_WORKERS = int(os.getenv('CALLBACK_WORKERS', '0'))
+PAIR_KEYS = os.getenv('PAIR_KEYS', 'False') == 'True'
 
 model_service = model.init(
     prediction_stream_name=PREDICTIONS_STREAM_NAME,
     run_id=RUN_ID,
     test_run=TEST_RUN,
+    callback_workers=CALLBACK_WORKERS,
+    pair_keys=PAIR_KEYS,
 )
 
 
@@ -1,9 +1,35 @@
 import os
+import sys
 import json
+import time
 import base64
+import shutil
+import hashlib
+import tempfile
+import threading
+from concurrent import futures
 
-import boto3
-import mlflow
+import native_model
+
+# boto3 and mlflow are imported lazily, only when they are needed,
+# to keep them out of the cold start of handlers that do not use them
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+RIDE_FIELDS = ('PULocationID', 'DOLocationID', 'trip_distance')
+
+# /tmp survives warm container reuse, the preload dir is baked into the image
+MODEL_CACHE_DIR = os.getenv('MODEL_CACHE_DIR', '/tmp/model_cache')
+MODEL_PRELOAD_DIR = os.getenv(
+    'MODEL_PRELOAD_DIR',
+    os.path.join(os.getenv('LAMBDA_TASK_ROOT', '.'), 'model_cache'),
+)
+# Check a baked-in model against the S3 artifact ETags before using it
+MODEL_PRELOAD_VERIFY = os.getenv('MODEL_PRELOAD_VERIFY', 'False') == 'True'
+NATIVE_MODEL_FILE = 'model.npz'
 
 
 def get_model_location(run_id):
@@ -17,27 +43,198 @@ def get_model_location(run_id):
     return model_location
 
 
+def create_s3_client():
+    import boto3  # pylint: disable=import-outside-toplevel
+
+    return boto3.client('s3')
+
+
+def parse_s3_uri(uri):
+    bucket, _, prefix = uri[len('s3://') :].partition('/')
+    return bucket, prefix.rstrip('/')
+
+
+def list_s3_objects(s3_client, bucket, prefix):
+    kwargs = {'Bucket': bucket, 'Prefix': prefix + '/'}
+    while True:
+        response = s3_client.list_objects_v2(**kwargs)
+        yield from response.get('Contents', [])
+        if not response.get('IsTruncated'):
+            return
+        kwargs['ContinuationToken'] = response['NextContinuationToken']
+
+
+def artifact_checksum(objects):
+    # Derived from the S3 ETags, so it changes whenever any artifact file does
+    digest = hashlib.sha256()
+    for obj in sorted(objects, key=lambda obj: obj['Key']):
+        digest.update(f"{obj['Key']}:{obj['ETag']}\n".encode('utf-8'))
+    return digest.hexdigest()[:16]
+
+
+def preloaded_model(run_id, preload_dir=None):
+    # The image is built with a single <run_id>/<checksum> copy of the model,
+    # anything else (no copy, several) is left to the S3 check
+    run_dir = os.path.join(preload_dir or MODEL_PRELOAD_DIR, str(run_id))
+    if not os.path.isdir(run_dir):
+        return None
+
+    entries = [entry for entry in os.scandir(run_dir) if entry.is_dir()]
+    if len(entries) != 1:
+        return None
+    return entries[0].path
+
+
+def cache_model(
+    run_id, model_location, s3_client=None, cache_dir=None, preload_dir=None
+):
+    cache_dir = cache_dir or MODEL_CACHE_DIR
+    preload_dir = preload_dir or MODEL_PRELOAD_DIR
+
+    # A model baked into the image is used without any S3 call
+    if not MODEL_PRELOAD_VERIFY:
+        local_path = preloaded_model(run_id, preload_dir)
+        if local_path is not None:
+            return local_path
+
+    s3_client = s3_client or create_s3_client()
+
+    bucket, prefix = parse_s3_uri(model_location)
+    objects = list(list_s3_objects(s3_client, bucket, prefix))
+    cache_key = os.path.join(str(run_id), artifact_checksum(objects))
+
+    for directory in (preload_dir, cache_dir):
+        local_path = os.path.join(directory, cache_key)
+        if os.path.isdir(local_path):
+            return local_path
+
+    # Download next to the target and rename, so a partial download is never used
+    local_path = os.path.join(cache_dir, cache_key)
+    os.makedirs(os.path.dirname(local_path), exist_ok=True)
+    tmp_path = tempfile.mkdtemp(dir=os.path.dirname(local_path))
+
+    for obj in objects:
+        target = os.path.join(tmp_path, os.path.relpath(obj['Key'], prefix))
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        s3_client.download_file(bucket, obj['Key'], target)
+
+    try:
+        os.rename(tmp_path, local_path)
+    except OSError:
+        # Another process cached the same artifact first
+        shutil.rmtree(tmp_path, ignore_errors=True)
+
+    return local_path
+
+
 def load_model(run_id):
     model_path = get_model_location(run_id)
+    if model_path.startswith('s3://'):
+        model_path = cache_model(run_id, model_path)
+
+    # Serve a native_model.py export without mlflow when one is available
+    native_path = os.path.join(model_path, NATIVE_MODEL_FILE)
+    if os.path.isfile(native_path):
+        model_path = native_path
+    if model_path.endswith('.npz'):
+        return native_model.NativePredictor.load(model_path)
+
+    import mlflow  # pylint: disable=import-outside-toplevel
+
     model = mlflow.pyfunc.load_model(model_path)
     return model
 
 
+def json_loads(data):
+    # Both parsers read the raw bytes, no intermediate str
+    if orjson is not None:
+        return orjson.loads(data)  # pylint: disable=no-member
+    return json.loads(data)
+
+
 def base64_decode(encoded_data):
-    decoded_data = base64.b64decode(encoded_data).decode('utf-8')
-    ride_event = json.loads(decoded_data)
+    ride_event = json_loads(base64.b64decode(encoded_data))
     return ride_event
 
 
+def validate_ride_event(ride_event):
+    if not isinstance(ride_event, dict) or 'ride_id' not in ride_event:
+        raise ValueError('ride_id is missing')
+
+    ride = ride_event.get('ride')
+    if not isinstance(ride, dict):
+        raise ValueError('ride is missing')
+
+    missing = [field for field in RIDE_FIELDS if field not in ride]
+    if missing:
+        raise ValueError(f'ride is missing fields: {missing}')
+
+
+def decode_records(records, decoder=base64_decode):
+    # Malformed records go to dead_letters instead of failing the batch
+    ride_events = []
+    dead_letters = []
+
+    for record in records:
+        try:
+            ride_event = decoder(record['kinesis']['data'])
+            validate_ride_event(ride_event)
+        except (KeyError, TypeError, ValueError) as error:
+            dead_letters.append({'record': record, 'error': str(error)})
+            continue
+        ride_events.append(ride_event)
+
+    return ride_events, dead_letters
+
+
+class CallbackExecutor:
+    def __init__(self, max_workers=4, max_pending=1000):
+        self.executor = futures.ThreadPoolExecutor(max_workers=max_workers)
+        # Backpressure: submit() blocks once max_pending calls are in flight
+        self.slots = threading.BoundedSemaphore(max_pending)
+        self.pending = []
+
+    def submit(self, callback, prediction_event):
+        self.slots.acquire()  # pylint: disable=consider-using-with
+        future = self.executor.submit(callback, prediction_event)
+        future.add_done_callback(lambda _: self.slots.release())
+        self.pending.append(future)
+
+    def flush(self):
+        pending, self.pending = self.pending, []
+        futures.wait(pending)
+        for future in pending:
+            # Re-raises the first callback error
+            future.result()
+
+
 class ModelService:
-    def __init__(self, model, model_version=None, callbacks=None):
+    def __init__(  # pylint: disable=too-many-arguments
+        self,
+        model,
+        model_version=None,
+        callbacks=None,
+        callback_executor=None,
+        decoder=base64_decode,
+        *,
+        pair_keys=False,
+    ):
         self.model = model
         self.model_version = model_version
         self.callbacks = callbacks or []
+        self.callback_executor = callback_executor
+        self.decoder = decoder
+        # Integer PU_DO keys, only understood by native_model.NativePredictor
+        self.pair_keys = pair_keys
 
     def prepare_features(self, ride):
         features = {}
-        features['PU_DO'] = f'{ride["PULocationID"]}_{ride["DOLocationID"]}'
+        if self.pair_keys:
+            features['PU_DO'] = native_model.pair_key(
+                ride['PULocationID'], ride['DOLocationID']
+            )
+        else:
+            features['PU_DO'] = f'{ride["PULocationID"]}_{ride["DOLocationID"]}'
         features['trip_distance'] = ride['trip_distance']
         return features
 
@@ -45,37 +242,67 @@ class ModelService:
         pred = self.model.predict(features)
         return float(pred[0])
 
+    def predict_batch(self, features_batch):
+        # One model call for the whole batch instead of one per record
+        if not features_batch:
+            return []
+        preds = self.model.predict(features_batch)
+        return [float(pred) for pred in preds]
+
     def lambda_handler(self, event):
         # print(json.dumps(event))
 
-        predictions_events = []
+        ride_events, dead_letters = decode_records(event['Records'], self.decoder)
 
-        for record in event['Records']:
-            encoded_data = record['kinesis']['data']
-            ride_event = base64_decode(encoded_data)
+        ride_ids = [ride_event['ride_id'] for ride_event in ride_events]
+        features_batch = [
+            self.prepare_features(ride_event['ride']) for ride_event in ride_events
+        ]
 
-            # print(ride_event)
-            ride = ride_event['ride']
-            ride_id = ride_event['ride_id']
+        predictions = self.predict_batch(features_batch)
 
-            features = self.prepare_features(ride)
-            prediction = self.predict(features)
+        predictions_events = []
 
+        for ride_id, prediction in zip(ride_ids, predictions):
             prediction_event = {
                 'model': 'ride_duration_prediction_model',
                 'version': self.model_version,
                 'prediction': {'ride_duration': prediction, 'ride_id': ride_id},
             }
 
-            for callback in self.callbacks:
-                callback(prediction_event)
+            self.dispatch(prediction_event)
 
             predictions_events.append(prediction_event)
 
-        return {'predictions': predictions_events}
+        self.flush_callbacks()
+
+        result = {'predictions': predictions_events}
+        if dead_letters:
+            result['dead_letters'] = dead_letters
+        return result
+
+    def dispatch(self, prediction_event):
+        for callback in self.callbacks:
+            if self.callback_executor is None:
+                callback(prediction_event)
+            else:
+                self.callback_executor.submit(callback, prediction_event)
+
+    def flush_callbacks(self):
+        # Wait for all dispatched events before returning from the handler
+        if self.callback_executor is not None:
+            self.callback_executor.flush()
+
+        # Buffered sinks (e.g. KinesisCallback) expose flush()
+        for callback in self.callbacks:
+            flush = getattr(callback, 'flush', None)
+            if flush is not None:
+                flush()
 
 
 def create_kinesis_client():
+    import boto3  # pylint: disable=import-outside-toplevel
+
     endpoint_url = os.getenv('KINESIS_ENDPOINT_URL')
     # print(f'Kinesis Endpoint: {endpoint_url}')
     # print(f'AWS Access Key ID: {os.getenv("AWS_ACCESS_KEY_ID")}')
@@ -85,31 +312,126 @@ def create_kinesis_client():
     return boto3.client('kinesis', endpoint_url=endpoint_url)
 
 
+# put_records API limits
+KINESIS_MAX_RECORDS = 500
+KINESIS_MAX_BATCH_BYTES = 5 * 1024 * 1024
+
+
+def chunk_kinesis_entries(entries):
+    chunk = []
+    chunk_bytes = 0
+
+    for entry in entries:
+        entry_bytes = len(entry['Data']) + len(entry['PartitionKey'].encode('utf-8'))
+
+        if chunk and (
+            len(chunk) >= KINESIS_MAX_RECORDS
+            or chunk_bytes + entry_bytes > KINESIS_MAX_BATCH_BYTES
+        ):
+            yield chunk
+            chunk = []
+            chunk_bytes = 0
+
+        chunk.append(entry)
+        chunk_bytes += entry_bytes
+
+    if chunk:
+        yield chunk
+
+
 class KinesisCallback:
-    def __init__(self, kinesis_client, prediction_stream_name):
+    def __init__(
+        self,
+        kinesis_client,
+        prediction_stream_name,
+        max_retries=5,
+        backoff_base=0.1,
+    ):
         self.kinesis_client = kinesis_client
         self.prediction_stream_name = prediction_stream_name
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.buffer = []
+
+    def __call__(self, prediction_event):
+        self.put_record(prediction_event)
 
     def put_record(self, prediction_event):
+        # Only buffer here, records are sent on flush()
         ride_id = prediction_event['prediction']['ride_id']
-        self.kinesis_client.put_record(
-            StreamName=self.prediction_stream_name,
-            Data=json.dumps(prediction_event),
-            PartitionKey=str(ride_id),
+        self.buffer.append(
+            {
+                'Data': json.dumps(prediction_event).encode('utf-8'),
+                'PartitionKey': str(ride_id),
+            }
+        )
+
+    def flush(self):
+        entries, self.buffer = self.buffer, []
+        for chunk in chunk_kinesis_entries(entries):
+            self.put_records(chunk)
+
+    def put_records(self, entries):
+        for attempt in range(self.max_retries + 1):
+            if attempt > 0:
+                time.sleep(self.backoff_base * 2 ** (attempt - 1))
+
+            response = self.kinesis_client.put_records(
+                StreamName=self.prediction_stream_name,
+                Records=entries,
+            )
+            if response.get('FailedRecordCount', 0) == 0:
+                return
+
+            # Retry only the entries that failed
+            entries = [
+                entry
+                for entry, result in zip(entries, response['Records'])
+                if 'ErrorCode' in result
+            ]
+
+        raise RuntimeError(
+            f'{len(entries)} records could not be put to {self.prediction_stream_name}'
         )
 
 
-def init(prediction_stream_name: str, run_id: str, test_run: bool):
+def init(
+    prediction_stream_name: str,
+    run_id: str,
+    test_run: bool,
+    callback_workers: int = 0,
+    pair_keys: bool = False,
+):
     # To Init the function and Kinesis callback
     model = load_model(run_id)
     callbacks = []
 
+    # mlflow pipelines still get the 'PU_DO' strings
+    pair_keys = pair_keys and isinstance(model, native_model.NativePredictor)
+
+    # Dispatch callbacks concurrently only when workers are configured
+    callback_executor = None
+    if callback_workers > 0:
+        callback_executor = CallbackExecutor(max_workers=callback_workers)
+
     # Only use Kinesis on a non-test run
     if not test_run:
         kinesis_client = create_kinesis_client()
         kinesis_callback = KinesisCallback(kinesis_client, prediction_stream_name)
-        callbacks.append(kinesis_callback.put_record)
+        callbacks.append(kinesis_callback)
 
     # Load the model
-    model_service = ModelService(model, model_version=run_id, callbacks=callbacks)
+    model_service = ModelService(
+        model,
+        model_version=run_id,
+        callbacks=callbacks,
+        callback_executor=callback_executor,
+        pair_keys=pair_keys,
+    )
     return model_service
+
+
+if __name__ == '__main__':
+    # Pre-populate the model cache, e.g. at image build: python model.py <run_id>
+    cache_run_id = sys.argv[1]
+    print(cache_model(cache_run_id, get_model_location(cache_run_id)))
@@ -0,0 +1,173 @@
+import sys
+
+import numpy as np
+
+# Compact serving artifact for DictVectorizer + regressor pipelines.
+# Exporting needs scikit-learn (and mlflow for model URIs), serving only numpy.
+
+LINEAR = 'linear'
+FOREST = 'forest'
+
+# PU_DO can also be passed as a PU * PAIR_BASE + DO integer key, which is
+# matched against the 'PU_DO=<PU>_<DO>' features without building a string
+PAIR_FEATURE = 'PU_DO'
+PAIR_BASE = 1000
+
+
+def pair_key(pickup_id, dropoff_id):
+    return int(pickup_id) * PAIR_BASE + int(dropoff_id)
+
+
+def pair_vocabulary(vocabulary, separator='='):
+    prefix = f'{PAIR_FEATURE}{separator}'
+    pairs = {}
+    for name, index in vocabulary.items():
+        pickup_id, _, dropoff_id = name[len(prefix) :].partition('_')
+        if name.startswith(prefix) and pickup_id.isdigit() and dropoff_id.isdigit():
+            pairs[pair_key(pickup_id, dropoff_id)] = index
+    return pairs
+
+
+def split_pipeline(pipeline):
+    # Accepts an sklearn Pipeline or the (dv, model) tuple from lin_reg.bin
+    if isinstance(pipeline, tuple):
+        return pipeline
+    steps = [step for _, step in pipeline.steps]
+    if len(steps) != 2:
+        raise ValueError(f'Expected a DictVectorizer + regressor pipeline, got {steps}')
+    return steps[0], steps[1]
+
+
+def forest_arrays(estimators):
+    # All trees concatenated, child indices shifted to be global
+    left, right, feature, threshold, value, roots = [], [], [], [], [], []
+    offset = 0
+
+    for estimator in estimators:
+        tree = estimator.tree_
+        is_leaf = tree.children_left == -1
+        roots.append(offset)
+        left.append(np.where(is_leaf, -1, tree.children_left + offset))
+        right.append(np.where(is_leaf, -1, tree.children_right + offset))
+        feature.append(np.where(is_leaf, 0, tree.feature))
+        threshold.append(tree.threshold)
+        value.append(tree.value[:, 0, 0])
+        offset += tree.node_count
+
+    return {
+        'left': np.concatenate(left).astype(np.int32),
+        'right': np.concatenate(right).astype(np.int32),
+        'feature': np.concatenate(feature).astype(np.int32),
+        'threshold': np.concatenate(threshold),
+        'value': np.concatenate(value),
+        'roots': np.array(roots, dtype=np.int32),
+    }
+
+
+def export_native(pipeline, path):
+    vectorizer, model = split_pipeline(pipeline)
+    arrays = {'vocabulary': np.array(vectorizer.feature_names_, dtype=str)}
+
+    if hasattr(model, 'coef_'):
+        arrays['kind'] = np.array(LINEAR)
+        arrays['coef'] = np.ravel(model.coef_).astype(np.float64)
+        arrays['intercept'] = np.array(np.ravel(model.intercept_)[0], dtype=np.float64)
+    elif hasattr(model, 'estimators_') or hasattr(model, 'tree_'):
+        estimators = getattr(model, 'estimators_', [model])
+        arrays['kind'] = np.array(FOREST)
+        arrays.update(forest_arrays(estimators))
+    else:
+        raise ValueError(f'Unsupported model type: {type(model).__name__}')
+
+    with open(path, 'wb') as f_out:
+        np.savez(f_out, **arrays)
+
+
+class NativePredictor:
+    def __init__(self, arrays, separator='='):
+        self.kind = str(arrays['kind'])
+        self.separator = separator
+        self.vocabulary = {
+            name: index for index, name in enumerate(arrays['vocabulary'].tolist())
+        }
+        self.pair_vocabulary = pair_vocabulary(self.vocabulary, separator)
+        self.arrays = {
+            name: array for name, array in arrays.items() if name != 'vocabulary'
+        }
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path, allow_pickle=False) as npz:
+            return cls({name: npz[name] for name in npz.files})
+
+    def vectorize(self, dicts):
+        # Same feature naming as DictVectorizer, unseen features are dropped.
+        # Returns padded (rows, max features per row) index and value arrays.
+        rows = []
+        for features in dicts:
+            row = []
+            for key, value in features.items():
+                if key == PAIR_FEATURE and isinstance(value, int):
+                    index, value = self.pair_vocabulary.get(value), 1.0
+                elif isinstance(value, str):
+                    name, value = f'{key}{self.separator}{value}', 1.0
+                    index = self.vocabulary.get(name)
+                else:
+                    index = self.vocabulary.get(key)
+                if index is not None:
+                    row.append((index, float(value)))
+            rows.append(row)
+
+        width = max((len(row) for row in rows), default=0)
+        indices = np.full((len(rows), width), -1, dtype=np.int32)
+        values = np.zeros((len(rows), width), dtype=np.float64)
+        for i, row in enumerate(rows):
+            for j, (index, value) in enumerate(row):
+                indices[i, j] = index
+                values[i, j] = value
+        return indices, values
+
+    def predict(self, dicts):
+        if isinstance(dicts, dict):
+            dicts = [dicts]
+        indices, values = self.vectorize(dicts)
+
+        if self.kind == LINEAR:
+            coef = np.append(self.arrays['coef'], 0.0)  # index -1 -> padding
+            return (coef[indices] * values).sum(axis=1) + self.arrays['intercept']
+        return self.predict_forest(indices, values)
+
+    def predict_forest(self, indices, values):
+        left = self.arrays['left']
+        right = self.arrays['right']
+        feature = self.arrays['feature']
+        threshold = self.arrays['threshold']
+
+        # One node per (row, tree), all walked down together
+        nodes = np.tile(self.arrays['roots'], (len(indices), 1))
+        # sklearn compares features as float32
+        values = values.astype(np.float32)
+
+        while True:
+            active = left[nodes] != -1
+            if not active.any():
+                break
+
+            node_feature = feature[nodes]
+            node_values = np.zeros(nodes.shape, dtype=np.float32)
+            for j in range(indices.shape[1]):
+                match = node_feature == indices[:, j : j + 1]
+                node_values = np.where(match, values[:, j : j + 1], node_values)
+
+            go_left = node_values <= threshold[nodes]
+            children = np.where(go_left, left[nodes], right[nodes])
+            nodes = np.where(active, children, nodes)
+
+        return self.arrays['value'][nodes].mean(axis=1)
+
+
+if __name__ == '__main__':
+    # python native_model.py <mlflow model uri> <output .npz>
+    import mlflow  # pylint: disable=import-outside-toplevel
+
+    export_native(mlflow.sklearn.load_model(sys.argv[1]), sys.argv[2])
@@ -1,4 +1,9 @@
+import json
+import base64
 import pathlib
+import threading
+
+import pytest
 
 import model
 
@@ -34,9 +39,11 @@ def test_prepare_features():
 class ModelMock:
     def __init__(self, value):
         self.value = value
+        self.calls = 0
 
     def predict(self, X):
         # pylint: disable=invalid-name
+        self.calls += 1
         n = len(X)
         return [self.value] * n
 
@@ -78,3 +85,240 @@ def test_lambda_handler():
         ]
     }
     assert actual_predictions == expected_predictions
+
+
+def test_predict_batch():
+    model_mock = ModelMock(10.0)
+    model_service = model.ModelService(model_mock)
+
+    features_batch = [
+        {'PU_DO': "130_205", 'trip_distance': 3.66},
+        {'PU_DO': "1_2", 'trip_distance': 1.0},
+    ]
+
+    actual_predictions = model_service.predict_batch(features_batch)
+
+    assert actual_predictions == [10.0, 10.0]
+    assert model_mock.calls == 1
+
+
+def test_lambda_handler_batch():
+    model_mock = ModelMock(10.0)
+    model_service = model.ModelService(model_mock, 'Test123')
+
+    records = []
+    for ride_id in range(3):
+        ride_event = {
+            "ride": {"PULocationID": 130, "DOLocationID": 205, "trip_distance": 3.66},
+            "ride_id": ride_id,
+        }
+        data = base64.b64encode(json.dumps(ride_event).encode('utf-8'))
+        records.append({"kinesis": {"data": data.decode('utf-8')}})
+
+    actual_predictions = model_service.lambda_handler({"Records": records})
+    actual_ride_ids = [
+        event['prediction']['ride_id'] for event in actual_predictions['predictions']
+    ]
+
+    assert actual_ride_ids == [0, 1, 2]
+    assert model_mock.calls == 1
+
+
+class KinesisClientMock:
+    def __init__(self, failures=0):
+        # Number of calls in which the first record is reported as failed
+        self.failures = failures
+        self.calls = []
+
+    def put_records(self, StreamName, Records):
+        # pylint: disable=invalid-name
+        self.calls.append((StreamName, Records))
+
+        results = [{'SequenceNumber': '1', 'ShardId': 'shardId-0'} for _ in Records]
+        if self.failures > 0:
+            self.failures -= 1
+            results[0] = {'ErrorCode': 'ProvisionedThroughputExceededException'}
+
+        failed = sum(1 for result in results if 'ErrorCode' in result)
+        return {'FailedRecordCount': failed, 'Records': results}
+
+
+def make_prediction_event(ride_id):
+    return {
+        'model': 'ride_duration_prediction_model',
+        'version': 'Test123',
+        'prediction': {'ride_duration': 10.0, 'ride_id': ride_id},
+    }
+
+
+def test_kinesis_callback_flush_chunks():
+    kinesis_mock = KinesisClientMock()
+    callback = model.KinesisCallback(kinesis_mock, 'ride_predictions')
+
+    for ride_id in range(1200):
+        callback(make_prediction_event(ride_id))
+
+    assert not kinesis_mock.calls
+
+    callback.flush()
+
+    chunk_sizes = [len(records) for _, records in kinesis_mock.calls]
+    assert chunk_sizes == [500, 500, 200]
+    assert not callback.buffer
+
+
+def test_kinesis_callback_retries_failed_records():
+    kinesis_mock = KinesisClientMock(failures=2)
+    callback = model.KinesisCallback(kinesis_mock, 'ride_predictions', backoff_base=0)
+
+    for ride_id in range(3):
+        callback(make_prediction_event(ride_id))
+    callback.flush()
+
+    chunk_sizes = [len(records) for _, records in kinesis_mock.calls]
+    assert chunk_sizes == [3, 1, 1]
+
+    retried = json.loads(kinesis_mock.calls[-1][1][0]['Data'])
+    assert retried['prediction']['ride_id'] == 0
+
+
+def test_lambda_handler_flushes_kinesis_callback():
+    kinesis_mock = KinesisClientMock()
+    callback = model.KinesisCallback(kinesis_mock, 'ride_predictions')
+    model_service = model.ModelService(ModelMock(10.0), 'Test123', [callback])
+
+    base64_input = read_text('data.b64')
+    event = {"Records": [{"kinesis": {"data": base64_input}}]}
+    model_service.lambda_handler(event)
+
+    assert len(kinesis_mock.calls) == 1
+
+
+def test_lambda_handler_concurrent_callbacks():
+    # Both callbacks must be running at the same time to pass the barrier
+    barrier = threading.Barrier(2, timeout=5)
+    received = []
+
+    def callback(prediction_event):
+        barrier.wait()
+        received.append(prediction_event['prediction']['ride_id'])
+
+    model_service = model.ModelService(
+        ModelMock(10.0),
+        'Test123',
+        callbacks=[callback, callback],
+        callback_executor=model.CallbackExecutor(max_workers=2),
+    )
+
+    base64_input = read_text('data.b64')
+    event = {"Records": [{"kinesis": {"data": base64_input}}]}
+    model_service.lambda_handler(event)
+
+    assert received == [256, 256]
+
+
+def test_callback_executor_flush_raises():
+    def failing_callback(prediction_event):
+        raise ValueError(prediction_event)
+
+    executor = model.CallbackExecutor(max_workers=2)
+    executor.submit(failing_callback, 'event')
+
+    with pytest.raises(ValueError):
+        executor.flush()
+
+
+def test_decode_records_dead_letters():
+    base64_input = read_text('data.b64')
+    missing_ride_id = base64.b64encode(b'{"ride": {"PULocationID": 1}}').decode('utf-8')
+    records = [
+        {"kinesis": {"data": base64_input}},
+        {"kinesis": {"data": "not base64 json"}},
+        {"kinesis": {"data": missing_ride_id}},
+        {"kinesis": {}},
+    ]
+
+    ride_events, dead_letters = model.decode_records(records)
+
+    assert [ride_event['ride_id'] for ride_event in ride_events] == [256]
+    assert [dead_letter['record'] for dead_letter in dead_letters] == records[1:]
+
+
+def test_lambda_handler_dead_letters():
+    model_service = model.ModelService(ModelMock(10.0), 'Test123')
+
+    base64_input = read_text('data.b64')
+    bad_record = {"kinesis": {"data": "not base64 json"}}
+    event = {"Records": [{"kinesis": {"data": base64_input}}, bad_record]}
+    actual_result = model_service.lambda_handler(event)
+
+    assert len(actual_result['predictions']) == 1
+    assert actual_result['dead_letters'][0]['record'] == bad_record
+
+
+class S3ClientMock:
+    def __init__(self, files):
+        # key -> (etag, content)
+        self.files = files
+        self.downloads = 0
+
+    def list_objects_v2(self, Bucket, Prefix):
+        # pylint: disable=invalid-name,unused-argument
+        contents = [
+            {'Key': key, 'ETag': etag}
+            for key, (etag, _) in self.files.items()
+            if key.startswith(Prefix)
+        ]
+        return {'Contents': contents, 'IsTruncated': False}
+
+    def download_file(self, bucket, key, filename):
+        # pylint: disable=unused-argument
+        self.downloads += 1
+        with open(filename, 'wt', encoding='utf-8') as f_out:
+            f_out.write(self.files[key][1])
+
+
+def test_cache_model(tmp_path):
+    s3_mock = S3ClientMock(
+        {
+            '1/run1/artifacts/model/MLmodel': ('"a"', 'flavors: {}'),
+            '1/run1/artifacts/model/model.pkl': ('"b"', 'pickle'),
+        }
+    )
+    model_location = 's3://bucket/1/run1/artifacts/model'
+
+    local_path = model.cache_model('run1', model_location, s3_mock, str(tmp_path))
+    assert s3_mock.downloads == 2
+    assert (pathlib.Path(local_path) / 'MLmodel').read_text() == 'flavors: {}'
+
+    # Warm start: same ETags, nothing is downloaded again
+    cached_path = model.cache_model('run1', model_location, s3_mock, str(tmp_path))
+    assert cached_path == local_path
+    assert s3_mock.downloads == 2
+
+    # A changed artifact gets a new cache entry
+    s3_mock.files['1/run1/artifacts/model/model.pkl'] = ('"c"', 'new pickle')
+    new_path = model.cache_model('run1', model_location, s3_mock, str(tmp_path))
+    assert new_path != local_path
+    assert s3_mock.downloads == 4
+
+
+def test_cache_model_preloaded(tmp_path, monkeypatch):
+    preload_dir = tmp_path / 'preload'
+    (preload_dir / 'run1' / 'abc').mkdir(parents=True)
+    model_location = 's3://bucket/1/run1/artifacts/model'
+
+    # No S3 client at all: the baked-in copy is used as it is
+    local_path = model.cache_model(
+        'run1', model_location, None, str(tmp_path / 'cache'), str(preload_dir)
+    )
+    assert local_path == str(preload_dir / 'run1' / 'abc')
+
+    # With MODEL_PRELOAD_VERIFY it is only used if the ETags still match
+    monkeypatch.setattr(model, 'MODEL_PRELOAD_VERIFY', True)
+    s3_mock = S3ClientMock({'1/run1/artifacts/model/MLmodel': ('"a"', 'flavors: {}')})
+    local_path = model.cache_model(
+        'run1', model_location, s3_mock, str(tmp_path / 'cache'), str(preload_dir)
+    )
+    assert local_path != str(preload_dir / 'run1' / 'abc')
+    assert s3_mock.downloads == 1
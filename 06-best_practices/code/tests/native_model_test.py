@@ -0,0 +1,80 @@
+import numpy as np
+import pytest
+from sklearn.ensemble import RandomForestRegressor
+from sklearn.pipeline import make_pipeline
+from sklearn.linear_model import LinearRegression
+from sklearn.feature_extraction import DictVectorizer
+
+import model
+import native_model
+
+
+def make_rides(count, seed):
+    rng = np.random.default_rng(seed)
+    return [
+        {
+            'PU_DO': f'{rng.integers(1, 20)}_{rng.integers(1, 20)}',
+            'trip_distance': float(rng.uniform(0.1, 20.0)),
+        }
+        for _ in range(count)
+    ]
+
+
+@pytest.mark.parametrize(
+    'regressor',
+    [
+        LinearRegression(),
+        RandomForestRegressor(n_estimators=10, max_depth=8, random_state=0),
+    ],
+)
+def test_native_predictor_parity(tmp_path, regressor):
+    train = make_rides(500, seed=1)
+    y_train = [ride['trip_distance'] * 3 + len(ride['PU_DO']) for ride in train]
+    pipeline = make_pipeline(DictVectorizer(), regressor)
+    pipeline.fit(train, y_train)
+
+    path = tmp_path / 'model.npz'
+    native_model.export_native(pipeline, path)
+    predictor = native_model.NativePredictor.load(path)
+
+    # Includes PU_DO pairs never seen in training
+    rides = make_rides(200, seed=2) + [{'PU_DO': '999_999', 'trip_distance': 1.0}]
+    np.testing.assert_allclose(predictor.predict(rides), pipeline.predict(rides))
+    assert predictor.predict(rides[0])[0] == pytest.approx(
+        pipeline.predict(rides[0])[0]
+    )
+
+
+def test_load_model_native(tmp_path, monkeypatch):
+    train = make_rides(100, seed=1)
+    pipeline = make_pipeline(DictVectorizer(), LinearRegression())
+    pipeline.fit(train, [ride['trip_distance'] for ride in train])
+    native_model.export_native(pipeline, tmp_path / 'model.npz')
+
+    monkeypatch.setenv('MODEL_LOCATION', str(tmp_path))
+    loaded_model = model.load_model('Test123')
+
+    assert isinstance(loaded_model, native_model.NativePredictor)
+
+
+def test_native_predictor_pair_keys(tmp_path):
+    train = make_rides(300, seed=1)
+    pipeline = make_pipeline(DictVectorizer(), LinearRegression())
+    pipeline.fit(train, [ride['trip_distance'] for ride in train])
+    native_model.export_native(pipeline, tmp_path / 'model.npz')
+    predictor = native_model.NativePredictor.load(tmp_path / 'model.npz')
+
+    rides = [
+        {'PULocationID': 3, 'DOLocationID': 17, 'trip_distance': 2.5},
+        {'PULocationID': 999, 'DOLocationID': 999, 'trip_distance': 1.0},
+    ]
+    string_service = model.ModelService(predictor)
+    pair_service = model.ModelService(predictor, pair_keys=True)
+
+    assert pair_service.prepare_features(rides[0])['PU_DO'] == 3017
+    np.testing.assert_allclose(
+        pair_service.predict_batch([pair_service.prepare_features(r) for r in rides]),
+        string_service.predict_batch(
+            [string_service.prepare_features(r) for r in rides]
+        ),
+    )
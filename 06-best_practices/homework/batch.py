@@ -5,6 +5,8 @@ import sys
 import pickle
 import pandas as pd
 
+from column_vectorizer import ColumnVectorizer
+
 
 year = int(sys.argv[1])
 month = int(sys.argv[2])
@@ -36,8 +38,8 @@ df = read_data(input_file)
 df['ride_id'] = f'{year:04d}/{month:02d}_' + df.index.astype('str')
 
 
-dicts = df[categorical].to_dict(orient='records')
-X_val = dv.transform(dicts)
+vectorizer = ColumnVectorizer.from_dict_vectorizer(dv, categorical)
+X_val = vectorizer.transform(df)
 y_pred = lr.predict(X_val)
 
 
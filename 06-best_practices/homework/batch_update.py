@@ -8,6 +8,9 @@ import pandas as pd
 import boto3
 import s3fs
 
+from column_vectorizer import ColumnVectorizer
+from trips import read_trips
+
 AWS_ENDPOINT_URL = 'http://localhost:4566'  # or the URL where LocalStack is running
 
 s3 = boto3.client('s3', endpoint_url=AWS_ENDPOINT_URL)
@@ -21,11 +24,12 @@ options = {
 }
 
 def read_data(filename):
-    if AWS_ENDPOINT_URL:
-        df = pd.read_parquet(filename, storage_options=options)
-    else:
-        df = pd.read_parquet(filename)
-    return df
+    # Only the columns prepare_data and the model use. Rides are filtered in
+    # prepare_data, the ride ids come from the row positions of the full file
+    columns = ['PULocationID', 'DOLocationID']
+    storage_options = options if AWS_ENDPOINT_URL else None
+    return read_trips(filename, columns=columns, min_duration=None,
+                      max_duration=None, storage_options=storage_options)
     
 def prepare_data(df, categorical):
     df['duration'] = df.tpep_dropoff_datetime - df.tpep_pickup_datetime
@@ -68,8 +72,8 @@ def main(year, month):
     df = prepare_data(df, categorical)
     df['ride_id'] = f'{year:04d}/{month:02d}_' + df.index.astype('str')
 
-    dicts = df[categorical].to_dict(orient='records')
-    X_val = dv.transform(dicts)
+    vectorizer = ColumnVectorizer.from_dict_vectorizer(dv, categorical)
+    X_val = vectorizer.transform(df)
     y_pred = lr.predict(X_val)
 
 
@@ -5,10 +5,13 @@ from datetime import datetime
 from io import StringIO
 
 import polars as pl
+import polars.selectors as cs
 import s3fs
 from flask import Flask, jsonify, request
 
-from utils.load_model import ModelService, standardize_data
+from utils.jobs import JobQueue
+from utils.load_model import ModelService
+from utils.s3_writer import PartitionWriter
 
 app = Flask(__name__)
 
@@ -16,6 +19,15 @@ import mlflow
 
 # Define S3 file system
 s3_file_system = s3fs.S3FileSystem()
+partition_writer = PartitionWriter(
+    s3_file_system,
+    file_format=os.getenv("OUTPUT_FORMAT", "csv"),
+    max_workers=int(os.getenv("UPLOAD_WORKERS", "8")),
+)
+
+# Job mode: /predict queues the upload and returns a job id, see /jobs/<job_id>
+JOB_MODE = os.getenv("JOB_MODE", "False") == "True"
+job_queue = JobQueue(max_workers=int(os.getenv("JOB_WORKERS", "2")))
 
 # Define MLFlow Tracking Server
 mlflow.set_tracking_uri("http://mlflow-server:5001")
@@ -23,37 +35,55 @@ mlflow.set_tracking_uri("http://mlflow-server:5001")
 logger = logging.getLogger(__name__)
 log_fmt = "%(asctime)s - %(name)s - %(levelname)s - %(message)s"
 logging.basicConfig(level=logging.INFO, format=log_fmt)
-    
+
 model_service = ModelService("BestWineDatasetModel")
 model = model_service.get_model_version()
 columns = model.get_columns()
+columns.get_scaler()
 model = model.load_model().model
 
-def temp_file_save(s3_file_system, group_write, date, s3_bucket, s3_path):
-    # Save to a local temporary file
-    with tempfile.NamedTemporaryFile(suffix=".csv", delete=False) as temp:
-        group_write.write_csv(temp.name)
 
-    # Then upload the temporary file to S3
-    s3_file_system.put(
-        temp.name, f'{s3_bucket}/{s3_path}{date.strftime("%Y%m%d")}/predictions.csv'
+def partition_path(s3_bucket, s3_path, date):
+    file_name = f"predictions.{partition_writer.file_format}"
+    return f'{s3_bucket}/{s3_path}{date.strftime("%Y%m%d")}/{file_name}'
+
+
+def read_upload(path):
+    # Scan lazily, so polars parses the file in parallel
+    return (
+        pl.scan_csv(path)
+        .with_columns(pl.col("date").str.to_date("%Y-%m-%dT%H:%M:%S.%f"))
+        .collect()
     )
-    logger.info(f"Uploaded predictions for {date.strftime('%Y%m%d')} to S3")
 
-    # Delete the local temporary file
-    os.remove(temp.name)
 
+def save_upload(csv_file):
+    # Spool the upload to disk in chunks instead of holding the request body
+    with tempfile.NamedTemporaryFile(suffix=".csv", delete=False) as temp:
+        csv_file.save(temp)
+    return temp.name
 
-@app.route("/predict", methods=["POST"])
-def predict():
-    csv_file = request.files.get("file")
-    if not csv_file:
-        return "No file uploaded.", 400
 
-    # Load DF
-    df = pl.read_csv(csv_file)
-    df = df.with_columns(pl.col("date").str.to_date("%Y-%m-%dT%H:%M:%S.%f"))
+def standardize_by_date(df, model_columns, id_col="Id"):
+    # Z-scores of the numeric model columns within each date group, computed
+    # for all dates in one pass with window expressions
+    cols_to_grab = (
+        df.select(model_columns)
+        .select(cs.integer().exclude(id_col), cs.float())
+        .columns
+    )
+    return df.select(
+        [
+            (
+                (pl.col(col) - pl.col(col).mean().over("date"))
+                / pl.col(col).std().over("date")
+            ).alias(f"{col}_std")
+            for col in cols_to_grab
+        ]
+    )
+
 
+def run_prediction(df, job=None):
     # Check columns
     df_model_vars = df.select(columns.original_columns)
     model_service.check_columns(df_model_vars)
@@ -62,25 +92,77 @@ def predict():
     s3_bucket = "sal-wine-quality"
     s3_path = f"models/{model_service.model_name}/preds/"
 
-    # Group by 'date' and process each group
-    for date in df.select("date").unique().to_series().to_list():
-        group = df.filter(pl.col("date") == date)
-        model_df = group.select(columns.original_columns)
+    # Score every row in one call, then split the output by date in one pass.
+    # Standardize with the training statistics, models logged without them
+    # fall back to per date statistics
+    if columns.scaler is not None:
+        df_std = columns.scaler.transform(df)
+    else:
+        df_std = standardize_by_date(df, columns.original_columns)
+    predictions = model.predict(df_std)
+    logger.debug(f"made predictions for {df.height} rows")
+
+    df = df.with_columns(pl.Series(predictions).alias("predictions"))
+    df_write = df.select("Id", "date", "predictions", "quality")
+
+    # Upload all dates concurrently, straight from memory
+    partitions = {}
+    for group_write in df_write.partition_by("date", maintain_order=True):
+        date = group_write["date"][0]
+        partitions[partition_path(s3_bucket, s3_path, date)] = (date, group_write)
+
+    on_written = None
+    if job is not None:
+        job.set_total(len(partitions))
+
+        def on_written(path):
+            job.add_output(partitions[path][0].isoformat(), f"s3://{path}")
+
+    partition_writer.write_partitions(
+        [(path, group_write) for path, (_, group_write) in partitions.items()],
+        on_written=on_written,
+    )
+
+
+def prediction_job(job, upload_path):
+    try:
+        df = read_upload(upload_path)
+    finally:
+        os.remove(upload_path)
+    run_prediction(df, job)
+
+
+@app.route("/predict", methods=["POST"])
+def predict():
+    csv_file = request.files.get("file")
+    if not csv_file:
+        return "No file uploaded.", 400
 
-        # Grab necessary columns, apply z-score scaling
-        df_std = standardize_data(model_df)
-        predictions = model.predict(df_std)
-        logging.debug("made predictions for date: {date}")
+    upload_path = save_upload(csv_file)
 
-        # Add predictions to DataFrame
-        group = group.with_columns(pl.Series(predictions).alias("predictions"))
-        group_write = group.select("Id", "date", "predictions", "quality")
+    if JOB_MODE:
+        job_id = job_queue.submit(prediction_job, upload_path)
+        return jsonify({"status": "queued", "job_id": job_id}), 202
 
-        temp_file_save(s3_file_system, group_write, date, s3_bucket, s3_path)
+    # Load DF
+    try:
+        df = read_upload(upload_path)
+    finally:
+        os.remove(upload_path)
+
+    run_prediction(df)
 
     return jsonify({"status": "success"}), 200
 
 
+@app.route("/jobs/<job_id>", methods=["GET"])
+def get_job(job_id):
+    job = job_queue.get(job_id)
+    if job is None:
+        return jsonify({"error": f"Unknown job {job_id}"}), 404
+    return jsonify(job), 200
+
+
 if __name__ == "__main__":
     # Run application
     app.run(host="0.0.0.0", port=8000)
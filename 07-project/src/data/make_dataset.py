@@ -5,9 +5,10 @@ from pathlib import Path
 
 import click
 import polars as pl
-import polars.selectors as cs
 from dotenv import find_dotenv, load_dotenv
 
+from src.features.build_features import Standardizer
+
 
 def import_data(df_path: Path) -> pl.DataFrame():
     """Import Data
@@ -64,23 +65,22 @@ class Preprocessor:
     #     y = data.select("quality")
     #     return X, y
 
+    def fit_scaler(self, data, id="Id", target="quality"):
+        """
+        Fit mean and std on the training data only, so val/test and the
+        served data are all scaled with the same statistics
+        """
+        self.scaler = Standardizer().fit(data, exclude=[id, target])
+        return self.scaler
+
     def standardize_data(self, data, id="Id", target="quality"):
         """
-        To get to STD 1 and Mean 0
-        Polars does not have a built in standardization function, so we have to do it manually
-        This is done separately for each dataset to avoid data leakage
+        To get to STD 1 and Mean 0, all columns in one select
+        Uses the statistics from fit_scaler, or fits them on this data if it was not called
         """
-        cols_to_grab = data.select(cs.integer().exclude(id, target), cs.float()).columns
-        for col_name in cols_to_grab:
-            if col_name == id:
-                None
-            else:
-                col_mean = data[col_name].mean()
-                col_std = data[col_name].std()
-                data = data.with_columns(
-                    ((data[col_name] - col_mean) / col_std).alias(f"{col_name}_std")
-                )
-        return data
+        if getattr(self, "scaler", None) is None:
+            self.fit_scaler(data, id=id, target=target)
+        return self.scaler.transform(data, keep_original=True)
 
 
 def create_streaming_date_column(data, starting_date=datetime(2023, 1, 1)):
@@ -97,7 +97,7 @@ def process_and_save_data(data, processor, name, output_filepath):
     """Processes data using the given processor and saves it to a file."""
 
     data_with_features = processor.standardize_data(data)
-    
+
     for dataset_name, dataset in [(name, data_with_features)]:
         export_data(
             output_path=Path(output_filepath, f"{dataset_name}.csv"), df=dataset
@@ -127,6 +127,10 @@ def main(input_filepath, output_filepath):
     # Split
     data_train, data_val, data_test = preprocessor.split_data(shuffled_data)
 
+    # Fit standardization on train, saved for training and serving
+    scaler = preprocessor.fit_scaler(data_train)
+    scaler.save(Path(output_filepath, "scaler.json"))
+
     # Process and save data
     logger.info("Saving data to csv")
     process_and_save_data(data_train, preprocessor, "train", output_filepath)
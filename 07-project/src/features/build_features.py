@@ -0,0 +1,95 @@
+import json
+
+import polars as pl
+import polars.selectors as cs
+
+
+def column_names(data):
+    """Column names of a DataFrame or LazyFrame, without collecting the data"""
+    if isinstance(data, pl.LazyFrame) and hasattr(data, "collect_schema"):
+        return data.collect_schema().names()
+    return data.columns
+
+
+class Standardizer:
+    """
+    Z-score numeric columns (to STD 1 and Mean 0)
+
+    fit() computes every mean and std in a single lazy select, transform()
+    applies all of the z-score expressions in a single select. Both accept a
+    polars DataFrame or LazyFrame, and transform() returns the same kind of
+    frame it is given, so LazyFrames (e.g. from scan_csv) stay out of core
+    until they are collected.
+
+    Example:
+        standardizer = Standardizer().fit(train, exclude=["Id", "quality"])
+        val_std = standardizer.transform(val)
+    """
+
+    def __init__(self, columns=None, mean=None, std=None, suffix="_std"):
+        self.columns = list(columns or [])
+        self.mean = dict(mean or {})
+        self.std = dict(std or {})
+        self.suffix = suffix
+
+    def fit(self, data, columns=None, exclude=()):
+        """
+        Args:
+            data (polars.DataFrame | polars.LazyFrame): Data to fit on
+            columns (list): Columns to standardize, defaults to every integer
+                and float column not in exclude
+            exclude (list): Columns left out of the default selection
+        """
+        lazy = data.lazy()
+        if columns is None:
+            columns = column_names(
+                lazy.select(cs.integer(), cs.float()).select(pl.exclude(exclude))
+            )
+        stats = (
+            lazy.select(
+                [pl.col(col).mean().alias(f"mean:{col}") for col in columns]
+                + [pl.col(col).std().alias(f"std:{col}") for col in columns]
+            )
+            .collect()
+            .row(0, named=True)
+        )
+        self.columns = list(columns)
+        self.mean = {col: stats[f"mean:{col}"] for col in columns}
+        self.std = {col: stats[f"std:{col}"] for col in columns}
+        return self
+
+    def expressions(self):
+        return [
+            ((pl.col(col) - self.mean[col]) / self.std[col]).alias(
+                f"{col}{self.suffix}"
+            )
+            for col in self.columns
+        ]
+
+    def transform(self, data, keep_original=False):
+        """
+        Returns only the "<col>_std" columns, or every column plus the
+        "<col>_std" columns with keep_original=True
+        """
+        if keep_original:
+            return data.with_columns(self.expressions())
+        return data.select(self.expressions())
+
+    def fit_transform(self, data, columns=None, exclude=(), keep_original=False):
+        return self.fit(data, columns, exclude).transform(data, keep_original)
+
+    def to_dict(self):
+        return {"columns": self.columns, "mean": self.mean, "std": self.std}
+
+    @classmethod
+    def from_dict(cls, scaler):
+        return cls(scaler["columns"], scaler["mean"], scaler["std"])
+
+    def save(self, path):
+        with open(path, "w", encoding="utf8") as f:
+            json.dump(self.to_dict(), f)
+
+    @classmethod
+    def load(cls, path):
+        with open(path, "r", encoding="utf8") as f:
+            return cls.from_dict(json.load(f))
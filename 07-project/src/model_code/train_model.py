@@ -79,6 +79,7 @@ def objective(
     valid: xgb.DMatrix,
     y_val: pl.DataFrame,
     metrics: str,
+    scaler_path: str = "scaler.json",
 ) -> Dict[str, Any]:
     """
     Train an XGBoost model with given parameters and datasets, log the training
@@ -111,6 +112,8 @@ def objective(
         mlflow.log_metric("rmse", rmse)
         # Log the columns file as an artifact
         mlflow.log_artifact("columns.json")
+        # And the standardization fitted in make_dataset, applied when serving
+        mlflow.log_artifact(scaler_path)
 
     return {"loss": rmse, "status": STATUS_OK}
 
@@ -148,7 +151,12 @@ def main(data_filepath, max_evals_var):
     logging.info("starting hyperparameter search")
     best_result = fmin(
         fn=lambda params: objective(
-            params, train, valid, importing.val.select("quality"), params['eval_metric']
+            params,
+            train,
+            valid,
+            importing.val.select("quality"),
+            params['eval_metric'],
+            str(Path(data_filepath, "scaler.json")),
         ),
         space=SEARCH_SPACE,
         algo=tpe.suggest,
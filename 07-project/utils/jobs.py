@@ -0,0 +1,92 @@
+import logging
+import threading
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+
+class Job:
+    """
+    Handle passed to a running job so it can report its progress
+    """
+
+    def __init__(self, job_queue, job_id):
+        self.job_queue = job_queue
+        self.job_id = job_id
+
+    def set_total(self, total):
+        self.job_queue.update(self.job_id, total=total)
+
+    def add_output(self, key, location):
+        self.job_queue.add_output(self.job_id, key, location)
+
+
+class JobQueue:
+    """
+    In-process job queue
+    submit() returns a job id straight away and a pool of worker threads runs
+    the jobs. Job state only lives in this process, so run a single app process
+    per queue. Only the last max_jobs finished jobs are kept
+    """
+
+    def __init__(self, max_workers=2, max_jobs=1000):
+        self.executor = ThreadPoolExecutor(max_workers=max_workers)
+        self.max_jobs = max_jobs
+        self.jobs = {}
+        self.lock = threading.Lock()
+
+    def submit(self, fn, *args):
+        """
+        Runs fn(job, *args) on a worker, where job is a Job handle
+        """
+        job_id = uuid.uuid4().hex
+        with self.lock:
+            self.jobs[job_id] = {
+                "id": job_id,
+                "status": "queued",
+                "total": None,
+                "completed": 0,
+                "outputs": {},
+                "error": None,
+            }
+            self.evict()
+        self.executor.submit(self.run, job_id, fn, *args)
+        return job_id
+
+    def run(self, job_id, fn, *args):
+        self.update(job_id, status="running")
+        try:
+            fn(Job(self, job_id), *args)
+        except Exception as e:  # pylint: disable=broad-except
+            logger.exception(f"Job {job_id} failed")
+            self.update(job_id, status="failed", error=str(e))
+        else:
+            self.update(job_id, status="succeeded")
+
+    def update(self, job_id, **fields):
+        with self.lock:
+            self.jobs[job_id].update(fields)
+
+    def add_output(self, job_id, key, location):
+        with self.lock:
+            job = self.jobs[job_id]
+            job["outputs"][key] = location
+            job["completed"] = len(job["outputs"])
+
+    def get(self, job_id):
+        with self.lock:
+            job = self.jobs.get(job_id)
+            if job is None:
+                return None
+            return {**job, "outputs": dict(job["outputs"])}
+
+    def evict(self):
+        # Drop the oldest finished jobs, dicts keep insertion order
+        finished = [
+            job_id
+            for job_id, job in self.jobs.items()
+            if job["status"] in ("succeeded", "failed")
+        ]
+        for job_id in finished[: max(len(self.jobs) - self.max_jobs, 0)]:
+            del self.jobs[job_id]
@@ -3,9 +3,10 @@ import logging
 
 import mlflow
 import polars as pl
-import polars.selectors as cs
 from mlflow.tracking import MlflowClient
 
+from src.features.build_features import Standardizer
+
 logger = logging.getLogger(__name__)
 log_fmt = "%(asctime)s - %(name)s - %(levelname)s - %(message)s"
 logging.basicConfig(level=logging.INFO, format=log_fmt)
@@ -19,6 +20,7 @@ class ModelService:
         self.model_stage = model_stage
         self.data = data
         self.model_version = None
+        self.scaler = None
 
     # Get the latest version of the model in the 'Production' stage
     def get_model_version(self):
@@ -62,6 +64,23 @@ class ModelService:
             logger.error(f"Could not load columns file: {e}")
             return None
         
+    def get_scaler(self):
+        try:
+            # Mean and std fitted on the training data, logged next to columns.json
+            scaler_file_path = mlflow_client.download_artifacts(
+                self.model_version.run_id, "scaler.json"
+            )
+            self.scaler = Standardizer.load(scaler_file_path)
+
+            logger.info('Loaded scaler file')
+            return self
+
+        except Exception as e:
+            # Older runs did not log a scaler
+            self.scaler = None
+            logger.error(f"Could not load scaler file: {e}")
+            return self
+
     def check_columns(self, data):
         if set(data.columns) != set(self.original_columns):
             print(f'Input cols: {set(data.columns)}')
@@ -71,24 +90,6 @@ class ModelService:
     def predict(self, data):
         logger.info("Making Predictions")
         return self.model.predict(data)
-    
-def standardize_data(data, id_col="Id"):
-    """
-    To get to STD 1 and Mean 0
-    Polars does not have a built in standardization function, so we have to do it manually
-    This is done separately for each dataset to avoid data leakage
-    """
-    cols_to_grab = data.select(cs.integer().exclude(id_col), cs.float()).columns
-    for col_name in cols_to_grab:
-        if col_name == id_col:
-            None
-        else:
-            col_mean = data[col_name].mean()
-            col_std = data[col_name].std()
-            data = data.with_columns(
-                ((data[col_name] - col_mean) / col_std).alias(f"{col_name}_std")
-            )
-    return data.select(cs.ends_with("_std"))
 
 
 # if __name__=='__main__':
@@ -0,0 +1,68 @@
+import logging
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from io import BytesIO
+
+logger = logging.getLogger(__name__)
+
+# S3 needs parts of at least 5MB for multipart uploads
+MIN_PART_SIZE = 5 * 1024 * 1024
+
+
+class PartitionWriter:
+    """
+    Upload polars DataFrames to S3 straight from memory
+    Each partition is serialized to an in-memory buffer (no temp files) and the
+    uploads run concurrently on a bounded thread pool. Buffers above
+    multipart_threshold are sent as multipart uploads of part_size parts
+    """
+
+    def __init__(
+        self,
+        s3_file_system,
+        file_format="csv",
+        max_workers=8,
+        multipart_threshold=16 * 1024 * 1024,
+        part_size=8 * 1024 * 1024,
+    ):
+        if file_format not in ("csv", "parquet"):
+            raise ValueError(f"Unsupported file format: {file_format}")
+        self.s3_file_system = s3_file_system
+        self.file_format = file_format
+        self.max_workers = max_workers
+        self.multipart_threshold = multipart_threshold
+        self.part_size = max(part_size, MIN_PART_SIZE)
+
+    def serialize(self, df):
+        buffer = BytesIO()
+        if self.file_format == "parquet":
+            df.write_parquet(buffer)
+        else:
+            df.write_csv(buffer)
+        return buffer.getvalue()
+
+    def write(self, path, df):
+        data = self.serialize(df)
+        if len(data) < self.multipart_threshold:
+            # Single PUT
+            self.s3_file_system.pipe_file(path, data)
+        else:
+            # s3fs uploads a part each time a block fills up
+            view = memoryview(data)
+            with self.s3_file_system.open(path, "wb", block_size=self.part_size) as f:
+                for start in range(0, len(view), self.part_size):
+                    f.write(view[start : start + self.part_size])
+        logger.info(f"Uploaded {len(data)} bytes to {path}")
+        return path
+
+    def write_partitions(self, partitions, on_written=None):
+        """
+        partitions: iterable of (s3 path, DataFrame)
+        on_written: optional callback, called with each path once it is uploaded
+        Returns the uploaded paths, raises the first upload error
+        """
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            futures = [executor.submit(self.write, path, df) for path, df in partitions]
+            for future in as_completed(futures):
+                if on_written is not None:
+                    on_written(future.result())
+            return [future.result() for future in futures]
@@ -0,0 +1,113 @@
+import numpy as np
+import pandas as pd
+import scipy.sparse as sp
+from sklearn.feature_extraction import DictVectorizer
+
+# Pickup/dropoff pairs as PU * PAIR_BASE + DO integer keys, location ids
+# are below 1000
+PAIR_BASE = 1000
+
+
+def pair_key(pu, do):
+    return pu.astype(np.int64) * PAIR_BASE + do.astype(np.int64)
+
+
+def pair_name(key):
+    # Legacy 'PU_DO' string of a pair key, e.g. 1004 -> '1_4'
+    return f'{key // PAIR_BASE}_{key % PAIR_BASE}'
+
+
+class ColumnVectorizer:
+    """
+    DictVectorizer that works on DataFrame columns instead of row dicts.
+
+    Gives the same matrix as dv.transform(df[columns].to_dict(orient='records')),
+    but each categorical column is matched against the vocabulary once per
+    distinct value and rows are only handled as numpy arrays, never as
+    Python dicts or strings.
+
+    value_names maps a categorical column to a function giving the vocabulary
+    name of a value, e.g. {'PU_DO': pair_name} for integer pair keys that
+    should match a DictVectorizer fitted on 'PU_DO' strings.
+    """
+
+    def __init__(self, categorical, numerical, separator='=', dtype=np.float64,
+                 value_names=None):
+        self.categorical = list(categorical)
+        self.numerical = list(numerical)
+        self.separator = separator
+        self.dtype = dtype
+        self.value_names = dict(value_names or {})
+
+    def feature_name(self, col, value):
+        value_name = self.value_names.get(col, str)
+        return f'{col}{self.separator}{value_name(value)}'
+
+    def fit(self, df):
+        feature_names = set(self.numerical)
+        for col in self.categorical:
+            for value in pd.unique(df[col].dropna()):
+                feature_names.add(self.feature_name(col, value))
+        self.set_vocabulary(sorted(feature_names))
+        return self
+
+    def fit_transform(self, df):
+        return self.fit(df).transform(df)
+
+    def set_vocabulary(self, feature_names):
+        self.feature_names_ = list(feature_names)
+        self.vocabulary_ = {name: i for i, name in enumerate(self.feature_names_)}
+
+    @classmethod
+    def from_dict_vectorizer(cls, dv, categorical, numerical=(), value_names=None):
+        # Reuses the vocabulary of an already fitted (e.g. pickled) DictVectorizer
+        vectorizer = cls(categorical, numerical, separator=dv.separator, dtype=dv.dtype,
+                         value_names=value_names)
+        vectorizer.set_vocabulary(dv.feature_names_)
+        return vectorizer
+
+    def to_dict_vectorizer(self):
+        # Fitted DictVectorizer with the same vocabulary, to save with the model
+        dv = DictVectorizer(separator=self.separator, dtype=self.dtype)
+        dv.feature_names_ = list(self.feature_names_)
+        dv.vocabulary_ = dict(self.vocabulary_)
+        return dv
+
+    def categorical_indices(self, column):
+        # Feature index of each row, -1 for missing or unseen values
+        codes, uniques = pd.factorize(column)
+        lookup = np.array(
+            [self.vocabulary_.get(self.feature_name(column.name, value), -1)
+             for value in uniques] + [-1],
+            dtype=np.int64,
+        )
+        return lookup[codes]  # code -1 (missing) picks the trailing -1
+
+    def transform(self, df):
+        n_rows = len(df)
+        indices, values = [], []
+
+        for col in self.categorical:
+            indices.append(self.categorical_indices(df[col]))
+            values.append(np.ones(n_rows, dtype=self.dtype))
+
+        for col in self.numerical:
+            index = self.vocabulary_.get(col, -1)
+            indices.append(np.full(n_rows, index, dtype=np.int64))
+            values.append(df[col].to_numpy(dtype=self.dtype))
+
+        if not indices:
+            return sp.csr_matrix((n_rows, len(self.feature_names_)), dtype=self.dtype)
+
+        # (rows, columns) arrays, kept entries are read out row by row
+        indices = np.column_stack(indices)
+        values = np.column_stack(values)
+        present = indices >= 0
+        indptr = np.concatenate([[0], np.cumsum(present.sum(axis=1))])
+
+        X = sp.csr_matrix(
+            (values[present], indices[present], indptr),
+            shape=(n_rows, len(self.feature_names_)),
+        )
+        X.sort_indices()
+        return X
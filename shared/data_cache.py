@@ -0,0 +1,249 @@
+import os
+import json
+import time
+import shutil
+import hashlib
+import functools
+import logging
+import tempfile
+import contextlib
+import urllib.request
+
+try:
+    import fcntl
+except ImportError:  # Windows: entries are not pinned against eviction
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+DATA_CACHE_DIR = os.getenv(
+    'DATA_CACHE_DIR', os.path.join(os.path.expanduser('~'), '.cache', 'trip-data')
+)
+DATA_CACHE_MAX_BYTES = int(os.getenv('DATA_CACHE_MAX_BYTES', str(20 * 1024**3)))
+# Serve from the cache only, never touch the network
+DATA_CACHE_OFFLINE = os.getenv('DATA_CACHE_OFFLINE', 'False') == 'True'
+
+META_FILE = 'meta.json'
+
+
+def http_info(url):
+    # ETag (or Last-Modified) and size of url from a HEAD request.
+    # urllib errors are OSErrors, like fsspec's
+    request = urllib.request.Request(url, method='HEAD')
+    with urllib.request.urlopen(request, timeout=60) as response:
+        headers = response.headers
+    size = headers.get('Content-Length')
+    return {
+        'ETag': headers.get('ETag') or headers.get('Last-Modified') or '',
+        'size': int(size) if size is not None else None,
+    }
+
+
+def http_download(url, path):
+    with urllib.request.urlopen(url, timeout=60) as response, open(path, 'wb') as f_out:
+        shutil.copyfileobj(response, f_out, 1024**2)
+
+
+class DataCache:
+    """
+    Local cache for remote files (https://, s3://, ...), keyed by URL + ETag
+    + size, so a file is downloaded again only when it changes remotely.
+
+    Each entry is a directory <cache_dir>/<key>/ with the file and a
+    meta.json. Downloads go to a temporary directory that is renamed into
+    place, so readers never see partial files. Least recently used entries
+    are removed once the cache is larger than max_bytes, except those a
+    process is reading through pinned().
+    """
+
+    def __init__(self, cache_dir=DATA_CACHE_DIR, max_bytes=DATA_CACHE_MAX_BYTES,
+                 offline=DATA_CACHE_OFFLINE):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.offline = offline
+
+    @staticmethod
+    def cache_key(url, etag, size):
+        return hashlib.sha256(f'{url}\n{etag}\n{size}'.encode()).hexdigest()[:32]
+
+    def fetch(self, url):
+        # Local paths are returned as they are
+        if '://' not in url or url.startswith('file://'):
+            return url
+        if self.offline:
+            return self.lookup(url)
+
+        try:
+            info, download = self.remote(url)
+        except (OSError, ValueError) as e:
+            logger.warning(f'could not stat {url} ({e}), trying the cache')
+            return self.lookup(url)
+
+        etag = (info.get('ETag') or info.get('etag') or '').strip('"')
+        return self.get(url, etag, info.get('size'), download)
+
+    @staticmethod
+    def remote(url):
+        # (info, download(tmp_path)) for url: http(s) through the standard
+        # library, other schemes (s3://, ...) through fsspec
+        if url.startswith(('http://', 'https://')):
+            return http_info(url), functools.partial(http_download, url)
+
+        import fsspec  # pylint: disable=import-outside-toplevel
+
+        fs, path = fsspec.core.url_to_fs(url)
+        return fs.info(path), functools.partial(fs.get_file, path)
+
+    def get(self, url, etag, size, download):
+        """
+        Path of the cached copy of url at this etag/size, calling
+        download(tmp_path) to fill the cache on a miss
+        """
+        key = self.cache_key(url, etag, size)
+        entry_dir = os.path.join(self.cache_dir, key)
+        file_path = os.path.join(entry_dir, os.path.basename(url.rstrip('/')) or 'data')
+
+        if os.path.exists(os.path.join(entry_dir, META_FILE)):
+            self.touch(entry_dir)
+            return file_path
+
+        os.makedirs(self.cache_dir, exist_ok=True)
+        tmp_dir = tempfile.mkdtemp(prefix='tmp-', dir=self.cache_dir)
+        try:
+            logger.info(f'downloading {url}')
+            download(os.path.join(tmp_dir, os.path.basename(file_path)))
+            with open(os.path.join(tmp_dir, META_FILE), 'w', encoding='utf-8') as f_out:
+                json.dump({'url': url, 'etag': etag, 'size': size,
+                           'fetched_at': time.time()}, f_out)
+            try:
+                os.rename(tmp_dir, entry_dir)
+            except OSError:
+                # Another process cached the same version first
+                if not os.path.exists(os.path.join(entry_dir, META_FILE)):
+                    raise
+        finally:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+
+        self.evict(keep=key)
+        return file_path
+
+    @contextlib.contextmanager
+    def pinned(self, url, etag=None, size=None, download=None, retries=3):
+        """
+        fetch(url), or get(url, etag, size, download) when download is given,
+        as a context manager: the entry cannot be evicted, by this or another
+        process, until the block exits. Holds a shared flock on its meta.json.
+        """
+        for _ in range(retries):
+            if download is None:
+                path = self.fetch(url)
+            else:
+                path = self.get(url, etag, size, download)
+            if path == url or fcntl is None:
+                yield path
+                return
+
+            meta_path = os.path.join(os.path.dirname(path), META_FILE)
+            try:
+                fd = os.open(meta_path, os.O_RDONLY)
+            except FileNotFoundError:
+                continue  # evicted since it was returned, fetch it again
+            try:
+                fcntl.flock(fd, fcntl.LOCK_SH)
+                # Still the live entry, not one evicted while we waited
+                try:
+                    live = os.path.samestat(os.fstat(fd), os.stat(meta_path))
+                except FileNotFoundError:
+                    live = False
+                if live:
+                    yield path
+                    return
+            finally:
+                os.close(fd)
+        raise FileNotFoundError(f'{url} was evicted from the data cache {retries} times')
+
+    def lookup(self, url):
+        # Most recently fetched cached version of url, whatever its etag
+        best = None
+        for key, meta in self.entries():
+            if meta['url'] == url and (best is None or meta['fetched_at'] > best[1]['fetched_at']):
+                best = (key, meta)
+        if best is None:
+            raise FileNotFoundError(f'{url} is not in the data cache {self.cache_dir}')
+
+        entry_dir = os.path.join(self.cache_dir, best[0])
+        self.touch(entry_dir)
+        return os.path.join(entry_dir, os.path.basename(url.rstrip('/')) or 'data')
+
+    def entries(self):
+        if not os.path.isdir(self.cache_dir):
+            return
+        for key in os.listdir(self.cache_dir):
+            try:
+                with open(os.path.join(self.cache_dir, key, META_FILE), encoding='utf-8') as f_in:
+                    yield key, json.load(f_in)
+            except (OSError, ValueError):
+                continue  # temporary download dirs and stray files
+
+    @staticmethod
+    def touch(entry_dir):
+        # The meta.json mtime is the last use, for LRU eviction
+        os.utime(os.path.join(entry_dir, META_FILE))
+
+    @staticmethod
+    def entry_size(entry_dir):
+        return sum(entry.stat().st_size for entry in os.scandir(entry_dir) if entry.is_file())
+
+    def remove(self, key):
+        # False when the entry is pinned by a reader
+        entry_dir = os.path.join(self.cache_dir, key)
+        if fcntl is None:
+            shutil.rmtree(entry_dir, ignore_errors=True)
+            return True
+
+        try:
+            fd = os.open(os.path.join(entry_dir, META_FILE), os.O_RDONLY)
+        except FileNotFoundError:
+            return True
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            os.close(fd)
+            return False
+        try:
+            shutil.rmtree(entry_dir, ignore_errors=True)
+        finally:
+            os.close(fd)
+        return True
+
+    def evict(self, keep=None):
+        entries = []
+        for key, _ in self.entries():
+            entry_dir = os.path.join(self.cache_dir, key)
+            last_used = os.path.getmtime(os.path.join(entry_dir, META_FILE))
+            entries.append((last_used, key, self.entry_size(entry_dir)))
+
+        total = sum(size for _, _, size in entries)
+        for _, key, size in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            if key == keep:
+                continue
+            if not self.remove(key):
+                logger.info(f'{key} is in use, not evicting it')
+                continue
+            logger.info(f'evicted {key} from the data cache')
+            total -= size
+
+
+def link_into(cached_path, target_path):
+    # Puts a cached file at target_path without copying it when possible
+    os.makedirs(os.path.dirname(target_path) or '.', exist_ok=True)
+    tmp_path = f'{target_path}.tmp'
+    if os.path.lexists(tmp_path):
+        os.remove(tmp_path)
+    try:
+        os.link(cached_path, tmp_path)
+    except OSError:
+        shutil.copyfile(cached_path, tmp_path)
+    os.replace(tmp_path, target_path)
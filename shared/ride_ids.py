@@ -0,0 +1,66 @@
+import os
+
+import numpy as np
+import pandas as pd
+
+# Ride ids as UUID strings, generated in bulk with numpy
+
+# Hash ride ids from the ride columns instead of random UUIDs
+DETERMINISTIC_RIDE_IDS = os.getenv('DETERMINISTIC_RIDE_IDS', 'False') == 'True'
+
+HEX_DIGITS = np.frombuffer(b'0123456789abcdef', dtype=np.uint8)
+RIDE_ID_SEEDS = (np.uint64(0x9e3779b97f4a7c15), np.uint64(0xc2b2ae3d27d4eb4f))
+
+
+def format_uuids(raw):
+    # (n, 16) bytes -> n strings in the str(uuid.UUID) format, without a
+    # Python object per row
+    hex_chars = np.empty((len(raw), 32), dtype=np.uint8)
+    hex_chars[:, 0::2] = HEX_DIGITS[raw >> 4]
+    hex_chars[:, 1::2] = HEX_DIGITS[raw & 0x0f]
+    chars = np.insert(hex_chars, [8, 12, 16, 20], ord('-'), axis=1)
+    return chars.view('S36').ravel().astype(str)
+
+
+def set_uuid_version(raw, version):
+    raw[:, 6] = (raw[:, 6] & 0x0f) | (version << 4)
+    raw[:, 8] = (raw[:, 8] & 0x3f) | 0x80
+    return raw
+
+
+def generate_uuids(n):
+    # Random (version 4) UUIDs, generated in bulk
+    raw = np.frombuffer(os.urandom(16 * n), dtype=np.uint8).reshape(n, 16).copy()
+    return format_uuids(set_uuid_version(raw, 4))
+
+
+def value_words(column):
+    # Column values as uint64 words: datetimes as ns since the epoch, numbers
+    # as float64 bits, so 4 and 4.0 give the same word
+    if pd.api.types.is_datetime64_any_dtype(column):
+        return column.to_numpy(dtype='datetime64[ns]').view(np.uint64)
+    return column.to_numpy(dtype=np.float64, na_value=np.nan).view(np.uint64)
+
+
+def hash_uuids(df, row_numbers, columns):
+    # Ids derived from the ride and its row number in the input, so re-running
+    # a month gives the same ids, scored at once or in batches, and identical
+    # rides still get different ids. Each 64-bit half chains the values
+    # through pandas' hash mix from its own seed
+    words = [value_words(df[col]) for col in columns]
+    words.append(np.asarray(row_numbers, dtype=np.uint64))
+    halves = []
+    for seed in RIDE_ID_SEEDS:
+        hashes = np.full(len(df), seed, dtype=np.uint64)
+        for word in words:
+            hashes = pd.util.hash_array(hashes ^ word)
+        halves.append(hashes)
+    raw = np.stack(halves, axis=1).astype('>u8').view(np.uint8).reshape(len(df), 16)
+    return format_uuids(set_uuid_version(raw.copy(), 8))
+
+
+def generate_ride_ids(df, row_numbers, columns):
+    # Hashed from columns with DETERMINISTIC_RIDE_IDS, random otherwise
+    if DETERMINISTIC_RIDE_IDS:
+        return hash_uuids(df, row_numbers, columns)
+    return generate_uuids(len(df))
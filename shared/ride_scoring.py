@@ -0,0 +1,108 @@
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from ride_ids import generate_ride_ids
+from trips import iter_trips, read_trips, trip_dataset
+
+# Reading and writing for the ride duration scoring scripts. The model and
+# its feature preparation are passed in, so each script keeps its own
+
+# Only the columns needed for scoring are read
+INPUT_COLUMNS = ['lpep_pickup_datetime', 'lpep_dropoff_datetime',
+                 'PULocationID', 'DOLocationID', 'trip_distance']
+
+# Hashed into the ride ids with DETERMINISTIC_RIDE_IDS, see ride_ids.py
+RIDE_ID_COLUMNS = INPUT_COLUMNS
+
+
+def read_dataframe(filename: str):
+    # Only the scoring columns, rides outside 1-60 minutes are dropped by the scan
+    df = read_trips(filename, columns=INPUT_COLUMNS, min_duration=1, max_duration=60)
+    return add_duration(df)
+
+
+def add_duration(df: pd.DataFrame, first_row=0):
+    # first_row is the input row number of df's first row, when df is a batch
+    row_numbers = first_row + np.arange(len(df))
+    df['duration'] = df.lpep_dropoff_datetime - df.lpep_pickup_datetime
+    df.duration = df.duration.dt.total_seconds() / 60
+    keep = ((df.duration >= 1) & (df.duration <= 60)).to_numpy()
+    df = df[keep]
+    df['ride_id'] = generate_ride_ids(df, row_numbers[keep], RIDE_ID_COLUMNS)
+    return df
+
+
+def make_result(df, y_pred, run_id):
+    df_result = pd.DataFrame()
+    df_result['ride_id'] = df['ride_id']
+    df_result['lpep_pickup_datetime'] = df['lpep_pickup_datetime']
+    df_result['lpep_dropoff_datetime'] = df['lpep_dropoff_datetime']
+    # Location ids stay strings in the output, as when PU_DO was built from them
+    df_result['PULocationID'] = df['PULocationID'].astype(str)
+    df_result['DOLocationID'] = df['DOLocationID'].astype(str)
+    df_result['actual_duration'] = df['duration']
+    df_result['predicted_duration'] = y_pred
+    df_result['diff'] = df_result['actual_duration'] - df_result['predicted_duration']
+    df_result['model_version'] = run_id
+    return df_result
+
+
+def iter_batches(input_file, batch_size):
+    # Scans one record batch at a time, so only a few batches of rows are in
+    # memory, with the same column and duration pushdown as read_dataframe
+    yield from iter_trips(input_file, batch_size, columns=INPUT_COLUMNS,
+                          min_duration=1, max_duration=60)
+
+
+def input_schema(input_file):
+    schema = trip_dataset(input_file).schema
+    return pa.schema([schema.field(col) for col in INPUT_COLUMNS])
+
+
+def write_empty_result(input_file, run_id, output_file, prepare):
+    # A file with no rides left after filtering still gets an output file,
+    # with the columns and types of a scored one
+    df = add_duration(input_schema(input_file).empty_table().to_pandas())
+    prepare(df)  # same column conversions as a scored batch
+    table = pa.Table.from_pandas(make_result(df, np.zeros(0), run_id),
+                                 preserve_index=False)
+    # Empty object columns come out as the null type
+    for index, field in enumerate(table.schema):
+        if pa.types.is_null(field.type):
+            table = table.set_column(index, field.name, table[field.name].cast(pa.string()))
+    pq.write_table(table, output_file)
+
+
+def apply_model_streaming(input_file, model, run_id, output_file, batch_size, prepare):
+    # Scores input_file batch by batch with model.predict(prepare(df)) and
+    # returns the number of rows written to output_file
+    writer = None
+    n_rows = 0
+    first_row = 0
+
+    try:
+        for df in iter_batches(input_file, batch_size):
+            batch_rows = len(df)
+            df = add_duration(df, first_row)
+            first_row += batch_rows
+            if len(df) == 0:
+                continue
+
+            y_pred = model.predict(prepare(df))
+            table = pa.Table.from_pandas(make_result(df, y_pred, run_id),
+                                         preserve_index=False)
+
+            if writer is None:
+                writer = pq.ParquetWriter(output_file, table.schema)
+            writer.write_table(table.cast(writer.schema))
+            n_rows += len(df)
+    finally:
+        if writer is not None:
+            writer.close()
+
+    if writer is None:
+        write_empty_result(input_file, run_id, output_file, prepare)
+
+    return n_rows
@@ -0,0 +1,173 @@
+import datetime
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.dataset as ds
+
+# Green files use lpep_*, yellow files tpep_* for the pickup/dropoff times
+TIME_COLUMN_PREFIXES = ("lpep", "tpep")
+CATEGORICAL = ["PULocationID", "DOLocationID"]
+
+
+def trip_dataset(sources, storage_options=None):
+    """
+    One pyarrow dataset over a single trip file or a list of monthly files.
+    Local paths are read directly, anything else (s3://, https://) through
+    its fsspec filesystem, opened with storage_options.
+    """
+    if isinstance(sources, str):
+        sources = [sources]
+    sources = list(sources)
+
+    filesystem = None
+    if "://" in sources[0] and not sources[0].startswith("file://"):
+        import fsspec  # pylint: disable=import-outside-toplevel
+
+        filesystem, _ = fsspec.core.url_to_fs(sources[0], **(storage_options or {}))
+        # HTTP paths keep their scheme, bucket paths are used without it
+        protocols = filesystem.protocol
+        if isinstance(protocols, str):
+            protocols = (protocols,)
+        if "http" not in protocols:
+            sources = [filesystem._strip_protocol(source) for source in sources]
+
+    return ds.dataset(sources, format="parquet", filesystem=filesystem)
+
+
+def time_columns(schema):
+    for prefix in TIME_COLUMN_PREFIXES:
+        pickup, dropoff = f"{prefix}_pickup_datetime", f"{prefix}_dropoff_datetime"
+        if pickup in schema.names and dropoff in schema.names:
+            return pickup, dropoff
+    raise ValueError(f"No pickup/dropoff columns in {schema.names}")
+
+
+def trip_filter(
+    pickup, dropoff, start=None, end=None, min_duration=None, max_duration=None
+):
+    """
+    Filter expression evaluated by pyarrow while scanning: start <= pickup < end
+    and min_duration <= duration <= max_duration (minutes). Row groups whose
+    pickup statistics fall outside [start, end) are not read at all.
+    """
+    pickup, dropoff = ds.field(pickup), ds.field(dropoff)
+    duration = pc.subtract(dropoff, pickup)
+    conditions = []
+
+    if start is not None:
+        conditions.append(pickup >= pa.scalar(start))
+    if end is not None:
+        conditions.append(pickup < pa.scalar(end))
+    if min_duration is not None:
+        conditions.append(
+            duration >= pa.scalar(datetime.timedelta(minutes=min_duration))
+        )
+    if max_duration is not None:
+        conditions.append(
+            duration <= pa.scalar(datetime.timedelta(minutes=max_duration))
+        )
+
+    expression = None
+    for condition in conditions:
+        expression = condition if expression is None else expression & condition
+    return expression
+
+
+def scan_trips(
+    sources,
+    columns=None,
+    categorical=CATEGORICAL,
+    start=None,
+    end=None,
+    min_duration=1,
+    max_duration=60,
+    storage_options=None,
+    batch_size=None,
+):
+    dataset = trip_dataset(sources, storage_options)
+    pickup, dropoff = time_columns(dataset.schema)
+    if columns is not None:
+        columns = list(dict.fromkeys([pickup, dropoff, *categorical, *columns]))
+
+    kwargs = {
+        "columns": columns,
+        "filter": trip_filter(pickup, dropoff, start, end, min_duration, max_duration),
+    }
+    if batch_size is not None:
+        kwargs["batch_size"] = batch_size
+    return dataset, (pickup, dropoff), kwargs
+
+
+def with_duration(df, pickup, dropoff, categorical=CATEGORICAL, cast_categorical=False):
+    df["duration"] = (df[dropoff] - df[pickup]).dt.total_seconds() / 60
+    if cast_categorical:
+        df[categorical] = df[categorical].astype(str)
+    return df
+
+
+def read_trips(
+    sources,
+    columns=None,
+    categorical=CATEGORICAL,
+    cast_categorical: bool = False,
+    start=None,
+    end=None,
+    min_duration: float = 1,
+    max_duration: float = 60,
+    storage_options=None,
+) -> pd.DataFrame:
+    """
+    Read one or more NYC taxi trip files (green or yellow, local or remote)
+    with a "duration" column in minutes.
+
+    Only the pickup/dropoff times, the categorical columns and `columns` are
+    read (every column when `columns` is None). The pickup date range
+    [start, end) and the [min_duration, max_duration] bounds are pushed into
+    the pyarrow scan, so filtered-out rides are never converted to pandas.
+    None disables a bound. The categorical columns are cast to str with
+    cast_categorical.
+    """
+    dataset, (pickup, dropoff), kwargs = scan_trips(
+        sources,
+        columns,
+        categorical,
+        start,
+        end,
+        min_duration,
+        max_duration,
+        storage_options,
+    )
+    df = dataset.to_table(**kwargs).to_pandas()
+    return with_duration(df, pickup, dropoff, categorical, cast_categorical)
+
+
+def iter_trips(
+    sources,
+    batch_size,
+    columns=None,
+    categorical=CATEGORICAL,
+    cast_categorical: bool = False,
+    start=None,
+    end=None,
+    min_duration: float = 1,
+    max_duration: float = 60,
+    storage_options=None,
+):
+    # Same as read_trips, one DataFrame of at most batch_size rows at a time
+    dataset, (pickup, dropoff), kwargs = scan_trips(
+        sources,
+        columns,
+        categorical,
+        start,
+        end,
+        min_duration,
+        max_duration,
+        storage_options,
+        batch_size,
+    )
+    for batch in dataset.to_batches(**kwargs):
+        if batch.num_rows:
+            yield with_duration(
+                batch.to_pandas(), pickup, dropoff, categorical, cast_categorical
+            )